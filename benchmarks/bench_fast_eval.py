@@ -0,0 +1,55 @@
+"""
+Expressions per second of MetaYaml.eval_value for trivial expressions,
+compared with rendering the same expressions by jinja.
+
+    python benchmarks/bench_fast_eval.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metayaml import MetaYaml  # noqa: E402
+from metayaml.jinja_eval import jinja_eval_value  # noqa: E402
+
+ROUNDS = 20000
+
+DATA = {
+    "hour": 3600,
+    "loggers": {"metayaml": {"level": "debug", "console": False}},
+    "services": [{"port": 8000}, {"port": 8001}],
+}
+
+EXPRESSIONS = [
+    "${hour}",
+    "${loggers.metayaml.level}",
+    "${services[1].port}",
+    "${60*60}",
+    "${10*60*1.5}",
+]
+
+
+def measure(func) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def main():
+    m = MetaYaml([])
+    for val in EXPRESSIONS:
+        jinja = measure(
+            lambda: jinja_eval_value(m, val, ("key",), DATA, True, m.eager_brackets)
+        )
+        fast = measure(lambda: m.eval_value(val, ("key",), DATA, True))
+        print(
+            f"{val:28s} jinja: {jinja:10.0f}/s  eval_value: {fast:10.0f}/s  "
+            f"x{fast / jinja:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
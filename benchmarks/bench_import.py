@@ -0,0 +1,68 @@
+"""
+Measures cold start: the time of a new interpreter which imports metayaml and reads a config.
+
+Every scenario runs in a fresh process several times, the median is printed together with
+the heavy modules which the scenario loaded.
+
+    python benchmarks/bench_import.py [rounds]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SCENARIOS = {
+    "python": "pass",
+    "import metayaml": "import metayaml",
+    "read plain config": "import metayaml; metayaml.read({plain!r})",
+    "read config with expressions": "import metayaml; metayaml.read({expressions!r})",
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+loaded = [m for m in ("yaml", "jinja2") if m in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def run(code: str, rounds: int):
+    durations = []
+    loaded = ""
+    for _ in range(rounds):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(code=code)],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+        ).stdout.split()
+        durations.append(float(out[0]))
+        loaded = out[1] if len(out) > 1 else ""
+    return statistics.median(durations), loaded
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "plain.yaml")
+        with open(plain, "w") as f:
+            f.write("db:\n  host: localhost\n  port: 5432\nworkers: 4\n")
+        expressions = os.path.join(tmp, "expressions.yaml")
+        with open(expressions, "w") as f:
+            f.write("port: 5432\nurl: db:${port}/${port + 1}\n")
+
+        for name, code in SCENARIOS.items():
+            code = code.format(plain=plain, expressions=expressions)
+            elapsed, loaded = run(code, rounds)
+            print(f"{name:<30}{elapsed * 1000:8.1f} ms   {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares a full read() with Reloader.reload() from a checkpoint after a change of the root file.
+
+The synthetic tree has many base files with plain keys and expressions, and a root file
+extending all of them, which is changed before every reload.
+
+    python benchmarks/bench_reload.py [number of base files]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metayaml import read  # noqa: E402
+from metayaml.reloader import Reloader  # noqa: E402
+
+KEYS = 50
+EXPRESSIONS = 10
+ROUNDS = 5
+
+
+def generate(path: str, files: int):
+    for i in range(files):
+        with open(os.path.join(path, f"base_{i:04d}.yaml"), "w") as f:
+            f.write(f"section_{i}:\n")
+            for k in range(KEYS):
+                f.write(f"  key_{k}: value {k}\n")
+            for k in range(EXPRESSIONS):
+                f.write(f"  expr_{k}: ${{section_{i}.key_{k} ~ ' ' ~ {k}}}\n")
+                f.write(f"  lazy_{k}: $(version * {k})\n")
+
+
+def write_root(path: str, version: int):
+    root = os.path.join(path, "root.yaml")
+    with open(root, "w") as f:
+        f.write("extend:\n  - base_*.yaml\n")
+        f.write(f"version: {version}\n")
+    stat = os.stat(root)
+    os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns + version * 10**9))
+    return root
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(tmp, files)
+        root = write_root(tmp, 0)
+        reloader = Reloader(root)
+        reloader.reload()
+
+        full = reload = 0.0
+        for version in range(1, ROUNDS + 1):
+            root = write_root(tmp, version)
+
+            start = time.perf_counter()
+            expected = read(root)
+            full += time.perf_counter() - start
+
+            start = time.perf_counter()
+            data, changed = reloader.reload()
+            reload += time.perf_counter() - start
+            assert data == expected
+
+        print(f"files={files}  keys={files * (KEYS + 2 * EXPRESSIONS + 1)}")
+        print(f"full read():        {full / ROUNDS * 1000:8.1f} ms")
+        print(f"Reloader.reload():  {reload / ROUNDS * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
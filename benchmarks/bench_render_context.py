@@ -0,0 +1,47 @@
+"""
+Measures how the cost of an expression render grows with the number of loaded keys.
+
+The config contains a fixed number of expressions, while the number of keys already
+loaded (passed as defaults) grows. With a render context that does not copy the
+namespace the time per expression stays flat, the remaining growth is the single
+pass over all keys done for lazy values.
+
+    python benchmarks/bench_render_context.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metayaml import read  # noqa: E402
+
+EXPRESSIONS = 1000
+
+
+def generate(path: str):
+    with open(path, "w") as f:
+        for i in range(EXPRESSIONS):
+            f.write(f"expr_{i}: ${{key_{i} + 1}}\n")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config.yaml")
+        generate(path)
+        for size in (1000, 5000, 10000, 50000, 100000):
+            defaults = {f"key_{i}": i for i in range(size)}
+            read(path, dict(defaults))  # warm up the template cache
+            start = time.perf_counter()
+            read(path, defaults)
+            elapsed = time.perf_counter() - start
+            print(
+                f"keys={size:7d}  total={elapsed * 1000:8.1f} ms  "
+                f"total per expression={elapsed / EXPRESSIONS * 1e6:8.1f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
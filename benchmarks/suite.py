@@ -0,0 +1,218 @@
+"""
+Benchmark suite of read() on synthetic config trees.
+
+Every scenario generates its files in a temporary directory and is read several times,
+the suite prints the median load time, the peak of traced memory and the number of
+memory blocks allocated during one read and still alive after it (the result and caches).
+
+    python benchmarks/suite.py [--scale N] [--rounds N] [--only NAME ...]
+                               [--save results.json] [--compare results.json]
+
+``--compare`` reports scenarios which became slower than the saved results by more
+than ``--threshold`` (20% by default) and exits with status 1 if there are any.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as tp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metayaml import read  # noqa: E402
+
+
+def deep_extend(path: str, scale: int) -> str:
+    """
+    Chain of files, every file extends the next one and overrides some of its keys
+    """
+    depth = 10 * scale
+    for i in range(depth):
+        with open(os.path.join(path, f"level_{i:04d}.yaml"), "w") as f:
+            if i + 1 < depth:
+                f.write(f"extend:\n  - level_{i + 1:04d}.yaml\n")
+            f.write("common:\n")
+            for k in range(20):
+                f.write(f"  key_{k}: level {i} value {k}\n")
+            f.write(f"level_{i}:\n  name: level {i}\n  depth: ${{{depth} - {i}}}\n")
+    return os.path.join(path, "level_0000.yaml")
+
+
+def wide_glob(path: str, scale: int) -> str:
+    """
+    Root file extends a pattern which matches many files
+    """
+    os.mkdir(os.path.join(path, "services"))
+    for i in range(50 * scale):
+        with open(os.path.join(path, "services", f"service_{i:04d}.yaml"), "w") as f:
+            f.write(f"services:\n  service_{i}:\n    port: {8000 + i}\n")
+            f.write(f"    url: http://localhost:${{services.service_{i}.port}}/\n")
+    root = os.path.join(path, "root.yaml")
+    with open(root, "w") as f:
+        f.write("extend:\n  - services/*.yaml\n")
+    return root
+
+
+def many_keys(path: str, scale: int) -> str:
+    """
+    One file with thousands of plain keys in nested sections
+    """
+    root = os.path.join(path, "root.yaml")
+    with open(root, "w") as f:
+        for s in range(10 * scale):
+            f.write(f"section_{s}:\n")
+            for k in range(100):
+                f.write(
+                    f"  key_{k}:\n    name: key {k}\n    value: {k}\n    flag: true\n"
+                )
+    return root
+
+
+def inherit(path: str, scale: int) -> str:
+    """
+    Many dicts inherit a big base dict and override a few of its values
+    """
+    root = os.path.join(path, "root.yaml")
+    with open(root, "w") as f:
+        f.write("base:\n")
+        for k in range(50):
+            f.write(f"  key_{k}:\n    value: {k}\n    tags: [a, b, c]\n")
+        for i in range(20 * scale):
+            f.write(f"child_{i}:\n  ${{__inherit__}}: base\n  key_0:\n    value: {i}\n")
+    return root
+
+
+def expressions(path: str, scale: int) -> str:
+    """
+    Eager references, computed values and lazy values which refer to other keys
+    """
+    root = os.path.join(path, "root.yaml")
+    with open(root, "w") as f:
+        f.write("env: production\nport: 8000\n")
+        for i in range(100 * scale):
+            f.write(f"item_{i}:\n")
+            f.write("  env: ${env}\n")
+            f.write(f"  port: ${{port + {i}}}\n")
+            f.write(f"  name: ${{env ~ '-' ~ {i}}}\n")
+            f.write(f"  url: $(item_{i}.name ~ ':' ~ item_{i}.port)\n")
+    return root
+
+
+def extend_list(path: str, scale: int) -> str:
+    """
+    Files extend the same list with ${__extend__}
+    """
+    files = 20 * scale
+    for i in range(files):
+        with open(os.path.join(path, f"part_{i:04d}.yaml"), "w") as f:
+            if i + 1 < files:
+                f.write(f"extend:\n  - part_{i + 1:04d}.yaml\n")
+            f.write("hosts:\n  ${__extend__}:\n")
+            for k in range(20):
+                f.write(f"    - host-{i}-{k}.example.com\n")
+    return os.path.join(path, "part_0000.yaml")
+
+
+SCENARIOS: tp.Dict[str, tp.Callable[[str, int], str]] = {
+    "deep_extend": deep_extend,
+    "wide_glob": wide_glob,
+    "many_keys": many_keys,
+    "inherit": inherit,
+    "expressions": expressions,
+    "extend_list": extend_list,
+}
+
+
+def measure(root: str, rounds: int) -> tp.Dict[str, float]:
+    read(root)  # warm up imports and the template cache
+
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        read(root)
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        data = read(root)  # noqa: F841, keep the result alive for the snapshot
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    return {
+        "time_ms": statistics.median(durations) * 1000,
+        "peak_kb": peak / 1024,
+        "blocks": blocks,
+    }
+
+
+def run(names: tp.List[str], scale: int, rounds: int) -> tp.Dict[str, dict]:
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = SCENARIOS[name](tmp, scale)
+            results[name] = measure(root, rounds)
+        r = results[name]
+        print(
+            f"{name:<14}{r['time_ms']:10.1f} ms{r['peak_kb']:12.0f} KiB{r['blocks']:10d} blocks"
+        )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tp.List[str]:
+    slower = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        ratio = r["time_ms"] / baseline[name]["time_ms"]
+        if ratio > 1 + threshold:
+            slower.append(
+                f"{name}: {baseline[name]['time_ms']:.1f} -> {r['time_ms']:.1f} ms"
+            )
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scale", type=int, default=1, help="size multiplier of configs"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="timed reads per scenario"
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--save", help="save results to json file")
+    parser.add_argument("--compare", help="compare with results saved by --save")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"scale={args.scale}  rounds={args.rounds}")
+    results = run(args.only, args.scale, args.rounds)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["scale"] != args.scale:
+            sys.exit(f"{args.compare} is saved with scale={baseline['scale']}")
+        slower = compare(results, baseline["results"], args.threshold)
+        for line in slower:
+            print(f"SLOWER {line}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,4 @@
+from .cache import FileCache, LRUCache, ResultCache, template_cache
+from .index import PathIndex
 from .metayaml import FileNotFound, MetaYaml, MetaYamlException, read
+from .profile import Profile
@@ -0,0 +1,63 @@
+"""
+Loading of configs from asyncio code.
+
+read() opens, globs, parses and renders files synchronously, so it is run in an executor
+and the event loop only awaits the result.
+"""
+
+import asyncio
+import functools
+import typing as tp
+from concurrent.futures import Executor
+
+from metayaml.cache import copy_tree
+from metayaml.metayaml import read
+
+
+async def read_async(
+    yaml_file, defaults=None, executor: tp.Optional[Executor] = None, **kwargs
+):
+    """
+    Reads and process yaml config files without blocking the event loop
+
+    :param yaml_file      yaml file name or list of file names
+    :param defaults       Dictionary with default values which can be use during parsing yaml files
+    :param executor       Executor to run read() in, the default executor of the loop if None.
+                          With process pool executor defaults and the result should be picklable
+    :param kwargs         Other arguments of read()
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(read, yaml_file, defaults, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def read_many(
+    yaml_files: tp.Iterable,
+    defaults=None,
+    limit: int = 4,
+    executor: tp.Optional[Executor] = None,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> tp.List:
+    """
+    Reads independent configs concurrently, not more than limit at once
+
+    :param yaml_files     Config file names (or lists of file names), the result is in the same order
+    :param defaults       Dictionary with default values, every config gets its own copy
+    :param limit          Maximal number of configs read at the same time
+    :param executor       Executor to run read() in, the default executor of the loop if None
+    :param return_exceptions  Return exceptions in the result list instead of raising the first one
+    :param kwargs         Other arguments of read()
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def read_one(yaml_file):
+        async with semaphore:
+            return await read_async(
+                yaml_file, copy_tree(defaults or {}), executor, **kwargs
+            )
+
+    return await asyncio.gather(
+        *(read_one(yaml_file) for yaml_file in yaml_files),
+        return_exceptions=return_exceptions,
+    )
@@ -0,0 +1,115 @@
+"""
+Loading of many configs which extend the same base files.
+
+All configs of a batch share one FileCache, so every file is parsed once, and one
+Checkpoints, so the data merged from a common sequence of base files with the same
+defaults is restored from a snapshot instead of being merged and evaluated again.
+"""
+
+import os
+import typing as tp
+from concurrent.futures import Executor
+
+from metayaml.cache import FileCache, copy_tree
+from metayaml.checkpoint import Checkpoints
+from metayaml.metayaml import MetaYaml
+
+
+def read_batch(
+    yaml_files: tp.Iterable,
+    defaults: tp.Optional[dict] = None,
+    file_cache: tp.Optional[FileCache] = None,
+    checkpoints: tp.Optional[Checkpoints] = None,
+    executor: tp.Optional[Executor] = None,
+    chunks: tp.Optional[int] = None,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> tp.List:
+    """
+    Reads many configs, the result is in the same order as yaml_files
+
+    :param yaml_files     Config file names (or lists of file names)
+    :param defaults       Dictionary with default values, every config gets its own copy
+    :param file_cache     FileCache instance, by default unbounded cache of the batch
+    :param checkpoints    Checkpoints instance, by default checkpoints of the batch
+    :param executor       Process pool executor to read configs in parallel. Configs are split
+                          into chunks of consecutive configs, every chunk has its own caches,
+                          so configs with common base files should be next to each other
+    :param chunks         Number of chunks for executor, by default the number of CPUs
+    :param return_exceptions  Return exceptions in the result list instead of raising the first one
+    :param kwargs         Other arguments of MetaYaml
+    """
+    yaml_files = list(yaml_files)
+    if executor is None:
+        return _read_chunk(
+            yaml_files, defaults, file_cache, checkpoints, return_exceptions, kwargs
+        )
+
+    return map_chunks(
+        executor,
+        _read_chunk,
+        yaml_files,
+        chunks,
+        defaults,
+        None,
+        None,
+        return_exceptions,
+        kwargs,
+    )
+
+
+def map_chunks(
+    executor: Executor,
+    function: tp.Callable[..., tp.List],
+    items: tp.List,
+    chunks: tp.Optional[int],
+    *args,
+) -> tp.List:
+    """
+    Splits items into chunks of consecutive items and calls function(chunk, *args) for
+    every chunk in the executor, the results of the chunks are joined in their order
+
+    :param chunks         Number of chunks, by default the number of CPUs
+    """
+    chunks = min(chunks or os.cpu_count() or 1, len(items)) or 1
+    size = -(-len(items) // chunks)
+    futures = [
+        executor.submit(function, items[i : i + size], *args)
+        for i in range(0, len(items), size)
+    ]
+    result = []
+    for future in futures:
+        result.extend(future.result())
+    return result
+
+
+def _read_chunk(
+    yaml_files: tp.List,
+    defaults: tp.Optional[dict],
+    file_cache: tp.Optional[FileCache],
+    checkpoints: tp.Optional[Checkpoints],
+    return_exceptions: bool,
+    kwargs: dict,
+) -> tp.List:
+    if file_cache is None:
+        file_cache = FileCache(None)
+    if checkpoints is None:
+        checkpoints = Checkpoints()
+
+    result = []
+    for yaml_file in yaml_files:
+        try:
+            m = MetaYaml(
+                yaml_file,
+                copy_tree(defaults or {}),
+                file_cache=file_cache,
+                checkpoints=checkpoints,
+                **kwargs,
+            )
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            result.append(e)
+        else:
+            result.append(m.data)
+    return result
@@ -0,0 +1,267 @@
+"""
+Precompiled config bundles.
+
+A bundle keeps everything read() needs from the file system: parsed documents of all
+included files, results of file name patterns and compiled code of the expressions.
+Loading a bundle gives the same result as read() of its files without parsing yaml
+and compiling templates.
+"""
+
+import hashlib
+import importlib.util
+import os
+import pickle
+import typing as tp
+import zlib
+from glob import glob
+
+from metayaml.cache import atomic_write, copy_tree, read_document
+from metayaml.exception import MetaYamlException
+from metayaml.metayaml import MetaYaml
+
+BUNDLE_MAGIC = b"MYBUNDLE"
+BUNDLE_VERSION = 1
+
+# arguments of MetaYaml which define the content of the bundle
+_OPTIONS = ("extend_key_word", "ignore_errors", "ignore_not_existed_files", "loader")
+
+
+class StaleBundle(MetaYamlException):
+    pass
+
+
+class DocumentLoader(MetaYaml):
+    """
+    MetaYaml which takes parsed documents and results of file name patterns from the
+    given dicts, files and patterns which are not there are read and added to them.
+
+    :param documents      (stamp, document) by file path
+    :param globs          Found file names by pattern
+    :param expressions    Set to collect (expression, brackets) of evaluated values, or None
+    :param read_missing   Read files and patterns which are not in documents and globs,
+                          otherwise StaleBundle is raised
+    :param check_hash     Add sha1 of the content to stamps of read files
+    """
+
+    def __init__(
+        self,
+        *args,
+        documents: tp.Dict[str, tp.Tuple[tp.Tuple, tp.Any]],
+        globs: tp.Dict[str, tp.List[str]],
+        expressions: tp.Optional[tp.Set[tp.Tuple[str, tp.Tuple[str, str]]]] = None,
+        read_missing: bool = True,
+        check_hash: bool = False,
+        **kwargs,
+    ):
+        self.documents = documents
+        self.known_globs = globs
+        self.expressions = expressions
+        self._read_missing = read_missing
+        self._hash_documents = check_hash
+        super().__init__(*args, **kwargs)
+
+    def _glob(self, pattern: str) -> tp.List[str]:
+        found = self.known_globs.get(pattern)
+        if found is None:
+            if not self._read_missing:
+                raise StaleBundle(f"File pattern {pattern} is not in the bundle")
+            found = self.known_globs.setdefault(pattern, super()._glob(pattern))
+        return list(found)
+
+    def _read_document(self, file_path: str):
+        entry = self.documents.get(file_path)
+        if entry is None:
+            if not self._read_missing:
+                raise StaleBundle(f"File {file_path} is not in the bundle")
+            stamp, document = read_document(
+                file_path, self.loader, check_hash=self._hash_documents
+            )
+            self.file_stamps[file_path] = stamp
+            self.documents.setdefault(file_path, (stamp, copy_tree(document)))
+            return document
+        stamp, document = entry
+        self.file_stamps[file_path] = stamp
+        return copy_tree(document)
+
+    def eval_value(self, val, path, global_data, eager):
+        if self.expressions is not None:
+            brackets = self.eager_brackets if eager else self.lazy_brackets
+            if isinstance(val, str) and brackets[0] in val:
+                self.expressions.add((val, brackets))
+        return super().eval_value(val, path, global_data, eager)
+
+
+def _options(kwargs: dict) -> dict:
+    options = {
+        "extend_key_word": "extend",
+        "ignore_errors": False,
+        "ignore_not_existed_files": False,
+        "loader": "full",
+    }
+    options.update((k, v) for k, v in kwargs.items() if k in _OPTIONS)
+    return options
+
+
+def file_list(yaml_file: tp.Union[str, tp.List[str]]) -> tp.List[str]:
+    """
+    Returns absolute names of the config files
+    """
+    if isinstance(yaml_file, str):
+        yaml_file = [yaml_file]
+    return [os.path.abspath(f) for f in yaml_file]
+
+
+def build_bundle(
+    yaml_file: tp.Union[str, tp.List[str]],
+    bundle_path: str,
+    defaults: tp.Optional[dict] = None,
+    **kwargs,
+) -> dict:
+    """
+    Reads config files and saves them to the bundle file
+
+    :param yaml_file      yaml file name or list of file names
+    :param bundle_path    The name of bundle file
+    :param defaults       Dictionary with default values which can be use during parsing yaml files
+    :param kwargs         Other arguments of MetaYaml
+    :return: the config data
+    """
+    from metayaml.jinja_eval import dump_templates
+
+    kwargs.pop("executor", None)
+    kwargs.pop("stream", None)
+    documents: tp.Dict[str, tp.Tuple[tp.Tuple, tp.Any]] = {}
+    expressions: tp.Set[tp.Tuple[str, tp.Tuple[str, str]]] = set()
+    m = DocumentLoader(
+        file_list(yaml_file),
+        defaults,
+        documents=documents,
+        globs={},
+        expressions=expressions,
+        check_hash=True,
+        **kwargs,
+    )
+
+    bundle = {
+        "yaml_file": file_list(yaml_file),
+        "options": _options(kwargs),
+        "documents": documents,
+        "globs": m.globs,
+        "templates": dump_templates(sorted(expressions), m.ignore_errors),
+    }
+    content = zlib.compress(pickle.dumps(bundle, pickle.HIGHEST_PROTOCOL))
+    header = BUNDLE_MAGIC + bytes([BUNDLE_VERSION]) + importlib.util.MAGIC_NUMBER
+    atomic_write(os.path.abspath(bundle_path), header + content)
+    return m.data
+
+
+def _read_bundle(bundle_path: str) -> dict:
+    with open(bundle_path, "rb") as f:
+        header = f.read(len(BUNDLE_MAGIC) + 1 + len(importlib.util.MAGIC_NUMBER))
+        expected = BUNDLE_MAGIC + bytes([BUNDLE_VERSION]) + importlib.util.MAGIC_NUMBER
+        if header != expected:
+            raise StaleBundle(f"{bundle_path} is not a bundle of this version")
+        return pickle.loads(zlib.decompress(f.read()))
+
+
+def _validate(bundle: dict, validate: tp.Optional[str]):
+    if validate is None:
+        return
+
+    if validate not in ("stat", "hash"):
+        raise MetaYamlException(f"Unknown validate mode {validate!r}")
+
+    for file_path, (stamp, _) in bundle["documents"].items():
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            raise StaleBundle(f"File {file_path} is removed")
+        if (st.st_mtime_ns, st.st_size) != stamp[:2]:
+            if validate == "stat":
+                raise StaleBundle(f"File {file_path} is changed")
+            with open(file_path, "rb") as f:
+                if hashlib.sha1(f.read()).digest() != stamp[2]:
+                    raise StaleBundle(f"File {file_path} is changed")
+
+    for pattern, found_files in bundle["globs"].items():
+        if sorted(glob(pattern)) != found_files:
+            raise StaleBundle(f"Files of {pattern} are changed")
+
+
+def load_bundle(
+    bundle_path: str,
+    defaults: tp.Optional[dict] = None,
+    validate: tp.Optional[str] = "stat",
+    **kwargs,
+) -> dict:
+    """
+    Loads config from the bundle file
+
+    :param bundle_path    The name of bundle file
+    :param defaults       Dictionary with default values which can be use during parsing yaml files
+    :param validate       "stat" - compare modification time and size of source files,
+                          "hash" - compare content of source files which modification time is changed,
+                          None - do not check source files
+    :param kwargs         Other arguments of MetaYaml
+    :raise StaleBundle    when the bundle does not match its source files
+    """
+    return _load_bundle(_read_bundle(bundle_path), defaults, validate, kwargs)
+
+
+def _load_bundle(
+    bundle: dict, defaults: tp.Optional[dict], validate: tp.Optional[str], kwargs: dict
+) -> dict:
+    from metayaml.jinja_eval import load_templates
+
+    _validate(bundle, validate)
+
+    options = bundle["options"]
+    load_templates(bundle["templates"], options["ignore_errors"])
+
+    kwargs.update(options)
+    kwargs.pop("executor", None)
+    kwargs.pop("stream", None)
+    m = DocumentLoader(
+        bundle["yaml_file"],
+        defaults,
+        documents=bundle["documents"],
+        globs=bundle["globs"],
+        read_missing=False,
+        **kwargs,
+    )
+    return m.data
+
+
+def read_bundle(
+    yaml_file: tp.Union[str, tp.List[str]],
+    bundle_path: str,
+    defaults: tp.Optional[dict] = None,
+    validate: tp.Optional[str] = "stat",
+    **kwargs,
+) -> dict:
+    """
+    Loads config from the bundle file, the bundle is built again
+    if it doesn't exist or doesn't match the source files
+
+    :param yaml_file      yaml file name or list of file names
+    :param bundle_path    The name of bundle file
+    :param defaults       Dictionary with default values which can be use during parsing yaml files
+    :param validate       How to check source files, see load_bundle
+    :param kwargs         Other arguments of MetaYaml
+    """
+    try:
+        bundle = _read_bundle(bundle_path)
+    except Exception:
+        bundle = None  # the bundle is missing or can't be unpickled
+    if (
+        isinstance(bundle, dict)
+        and bundle.get("yaml_file") == file_list(yaml_file)
+        and bundle.get("options") == _options(kwargs)
+    ):
+        try:
+            return _load_bundle(
+                bundle, copy_tree(defaults or {}), validate, dict(kwargs)
+            )
+        except StaleBundle:
+            pass
+    return build_bundle(yaml_file, bundle_path, defaults, **kwargs)
@@ -0,0 +1,321 @@
+import os
+import tempfile
+import threading
+import time
+import typing as tp
+from collections import OrderedDict, namedtuple
+from glob import glob
+
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"]
+)
+
+_missing = object()
+
+
+class LRUCache(object):
+    """
+    Thread-safe bounded mapping with least recently used eviction
+
+    :param maxsize  Maximal number of stored items, None means unbounded
+    """
+
+    def __init__(self, maxsize: tp.Optional[int] = 1024):
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self._maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self) -> tp.Optional[int]:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: tp.Optional[int]):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _missing)
+            if value is _missing:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def _evict(self):
+        if self._maxsize is None:
+            return
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, self._maxsize, len(self._data)
+            )
+
+    def cache_clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+# compiled templates shared by all MetaYaml instances of the process,
+# keys are (expression, brackets, undefined class)
+template_cache = LRUCache(maxsize=4096)
+
+
+def copy_tree(value):
+    """
+    Copies dicts and lists of parsed yaml document, scalars are shared
+    """
+    if isinstance(value, dict):
+        return {k: copy_tree(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(v) for v in value]
+    return value
+
+
+def fingerprint(value) -> tp.Hashable:
+    """
+    Returns hashable representation of data structure.
+
+    Dicts and lists are compared by content, other unhashable objects by identity.
+    """
+    if isinstance(value, dict):
+        return dict, tuple((fingerprint(k), fingerprint(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(fingerprint(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return id, id(value)
+    return type(value), value
+
+
+def _sha1(content: bytes) -> bytes:
+    import hashlib
+
+    return hashlib.sha1(content).digest()
+
+
+def read_document(file_path: str, loader: type, check_hash: bool = False):
+    """
+    Parses yaml file, returns file stamp (mtime_ns, size[, sha1]) and the document
+    """
+    import yaml
+
+    with open(file_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        stamp: tp.Tuple = (st.st_mtime_ns, st.st_size)
+        if not check_hash:
+            return stamp, yaml.load(f, loader)
+
+        content = f.read()
+        stamp += (_sha1(content),)
+        return stamp, yaml.load(content, loader)
+
+
+def atomic_write(path: str, content: bytes):
+    """
+    Writes the file through a unique temporary file in the same directory, which
+    replaces the file atomically, so readers see either the old or the new content
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def file_stamp(file_path: str, previous: tp.Tuple) -> tp.Tuple:
+    """
+    Returns the current stamp of the file in the form of the previous one, sha1 of the
+    content is computed only when modification time and size are the same
+    """
+    st = os.stat(file_path)
+    stamp: tp.Tuple = (st.st_mtime_ns, st.st_size)
+    if len(previous) > 2 and stamp == previous[:2]:
+        with open(file_path, "rb") as f:
+            stamp += (_sha1(f.read()),)
+    return stamp
+
+
+class FileCache(object):
+    """
+    Cache of parsed yaml documents.
+
+    Documents are stored per absolute path and loader and are valid until the
+    file modification time or size is changed (or content when check_hash is set).
+    Every call returns own copy of the document, so the caller can modify it.
+
+    :param maxsize     Maximal number of cached documents, None means unbounded
+    :param check_hash  Compare the sha1 of file content in addition to mtime and size
+    """
+
+    def __init__(self, maxsize: tp.Optional[int] = 1024, check_hash: bool = False):
+        self._cache = LRUCache(maxsize)
+        self.check_hash = check_hash
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, file_path: str, loader: type):
+        return self.load_stamped(file_path, loader)[1]
+
+    def load_stamped(self, file_path: str, loader: type) -> tp.Tuple[tp.Tuple, tp.Any]:
+        """
+        Returns file stamp (mtime_ns, size[, sha1]) and copy of the document
+        """
+        found = self.lookup(file_path, loader)
+        if found is not None:
+            return found
+
+        stamp, document = read_document(file_path, loader, self.check_hash)
+        self.store(file_path, loader, stamp, document)
+        return stamp, copy_tree(document)
+
+    def lookup(
+        self, file_path: str, loader: type
+    ) -> tp.Optional[tp.Tuple[tp.Tuple, tp.Any]]:
+        """
+        Returns file stamp and copy of the document if the cached document is up to date
+        """
+        file_path = os.path.abspath(file_path)
+        cached = self._cache.get((file_path, loader))
+        if cached is not None:
+            stamp = file_stamp(file_path, cached[0])
+            if cached[0] == stamp:
+                self.hits += 1
+                return stamp, copy_tree(cached[1])
+
+        self.misses += 1
+        return None
+
+    def store(self, file_path: str, loader: type, stamp: tp.Tuple, document):
+        self._cache.set((os.path.abspath(file_path), loader), (stamp, document))
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def cache_info(self) -> CacheInfo:
+        info = self._cache.cache_info()
+        return info._replace(hits=self.hits, misses=self.misses)
+
+    def cache_clear(self):
+        self._cache.cache_clear()
+        self.hits = self.misses = 0
+
+
+class ResultCache(object):
+    """
+    Cache of read() results.
+
+    A result is stored per file list, options and content of defaults, and is valid until
+    any file it was read from is changed or a file name pattern finds other files.
+    Every call returns own copy of the data (frozen data is returned as is).
+
+    :param maxsize      Maximal number of cached results, None means unbounded
+    :param ttl          Seconds after which a result is read again even if files are the same
+    :param check_files  Check files on every call, if False a result is used until ttl expires
+    """
+
+    def __init__(
+        self,
+        maxsize: tp.Optional[int] = 128,
+        ttl: tp.Optional[float] = None,
+        check_files: bool = True,
+    ):
+        self._cache = LRUCache(maxsize)
+        self.ttl = ttl
+        self.check_files = check_files
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: tp.Hashable):
+        """
+        Returns the stored result if it is up to date, otherwise None
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            created, data, file_stamps, globs = cached
+            if (self.ttl is None or time.monotonic() - created < self.ttl) and (
+                not self.check_files or _up_to_date(file_stamps, globs)
+            ):
+                self.hits += 1
+                return data
+            self._cache.pop(key)
+
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        key: tp.Hashable,
+        data,
+        file_stamps: tp.Dict[str, tp.Tuple],
+        globs: tp.Dict[str, tp.List[str]],
+    ):
+        self._cache.set(key, (time.monotonic(), data, dict(file_stamps), dict(globs)))
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def cache_info(self) -> CacheInfo:
+        info = self._cache.cache_info()
+        return info._replace(hits=self.hits, misses=self.misses)
+
+    def cache_clear(self):
+        self._cache.cache_clear()
+        self.hits = self.misses = 0
+
+
+def _up_to_date(
+    file_stamps: tp.Dict[str, tp.Tuple], globs: tp.Dict[str, tp.List[str]]
+) -> bool:
+    for file_path, stamp in file_stamps.items():
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        if (st.st_mtime_ns, st.st_size) != stamp[:2]:
+            return False
+        if len(stamp) > 2:
+            with open(file_path, "rb") as f:
+                if _sha1(f.read()) != stamp[2]:
+                    return False
+
+    for pattern, found_files in globs.items():
+        if sorted(glob(pattern)) != found_files:
+            return False
+    return True
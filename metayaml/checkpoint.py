@@ -0,0 +1,48 @@
+import typing as tp
+
+from metayaml.cache import LRUCache, copy_tree
+
+
+class Checkpoints(object):
+    """
+    Snapshots of the merged data shared between MetaYaml loads.
+
+    The state of the data is defined by the initial data and the sequence of merged
+    files (path and file stamp), the key of the state after a merge is
+    (previous key, (path, stamp)). Every load records these keys. When a load
+    leaves a sequence which was seen before, the data at this branch point is saved,
+    so the next load with the same prefix restores the snapshot instead of merging
+    the files of the prefix again.
+
+    :param maxsize      Maximal number of kept snapshots
+    :param max_prefixes Maximal number of remembered merge sequence prefixes
+    """
+
+    def __init__(
+        self, maxsize: tp.Optional[int] = 16, max_prefixes: tp.Optional[int] = 65536
+    ):
+        self._snapshots = LRUCache(maxsize)
+        self._prefixes = LRUCache(max_prefixes)
+
+    def is_known(self, key: tp.Tuple) -> bool:
+        return key in self._prefixes
+
+    def snapshot(self, key: tp.Tuple) -> tp.Optional[dict]:
+        return self._snapshots.get(key)
+
+    def save(self, key: tp.Tuple, data: dict):
+        if key not in self._snapshots:
+            self._snapshots.set(key, copy_tree(data))
+
+    def record(self, key: tp.Tuple):
+        self._prefixes.set(key, True)
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def cache_info(self):
+        return self._snapshots.cache_info()
+
+    def cache_clear(self):
+        self._snapshots.cache_clear()
+        self._prefixes.cache_clear()
@@ -0,0 +1,153 @@
+"""
+Evaluation of trivial expressions without jinja.
+
+Plain references like ``${loggers.metayaml.level}`` or ``${items[0]}`` are resolved by
+direct lookup in the data with the same attribute/item rules as jinja uses, literal
+arithmetic like ``${60*60}`` is rendered by jinja once and reused. Anything else or any
+lookup failure falls back to jinja, so results and errors are the same.
+"""
+
+import re
+import typing as tp
+
+from metayaml.cache import LRUCache
+
+_IDENT = r"[A-Za-z_][A-Za-z0-9_]*"
+_STEP = rf"\.{_IDENT}|\.\d+|\[\s*(?:-?\d+|'[\w .-]*'|\"[\w .-]*\")\s*\]"
+_REFERENCE_RE = re.compile(rf"\s*({_IDENT})((?:{_STEP})*)\s*")
+_STEP_RE = re.compile(_STEP)
+_CONSTANT_RE = re.compile(r"[\d\s+\-*/%().]*\d[\d\s+\-*/%().]*")
+
+# names which are literals or operators in jinja expressions
+_RESERVED = frozenset(
+    [
+        "true",
+        "false",
+        "none",
+        "True",
+        "False",
+        "None",
+        "and",
+        "or",
+        "not",
+        "in",
+        "is",
+        "if",
+        "else",
+    ]
+)
+_DICT_ATTRIBUTES = frozenset(dir(dict))
+
+_ATTR = 0
+_ITEM = 1
+
+_not_simple = object()
+
+# parsed expressions, keys are (expression, brackets)
+simple_cache = LRUCache(maxsize=4096)
+
+
+def coerce(result):
+    if isinstance(result, str):
+        for t in [int, float]:
+            try:
+                return t(result)
+            except (ValueError, TypeError):
+                pass
+    return result
+
+
+class SimpleExpression(object):
+    __slots__ = ("name", "steps", "constant", "value")
+
+    def __init__(self, name: tp.Optional[str], steps: tp.Tuple = (), constant=False):
+        self.name = name
+        self.steps = steps
+        self.constant = constant
+        self.value = _not_simple
+
+    def resolve(self, data) -> tp.Tuple[bool, tp.Any]:
+        """
+        Returns (True, value) or (False, None) when the value should be rendered by jinja
+        """
+        if self.constant:
+            return self.value is not _not_simple, self.value
+
+        try:
+            obj = data[self.name]
+        except (KeyError, TypeError):
+            return False, None
+
+        for kind, key in self.steps:
+            if kind == _ATTR:
+                if type(obj) is dict and key not in _DICT_ATTRIBUTES:
+                    try:
+                        obj = obj[key]
+                        continue
+                    except KeyError:
+                        return False, None
+                try:
+                    obj = getattr(obj, key)
+                    continue
+                except AttributeError:
+                    pass
+                try:
+                    obj = obj[key]
+                except (TypeError, LookupError, AttributeError):
+                    return False, None
+            else:
+                try:
+                    obj = obj[key]
+                    continue
+                except (AttributeError, TypeError, LookupError):
+                    pass
+                if not isinstance(key, str):
+                    return False, None
+                try:
+                    obj = getattr(obj, key)
+                except AttributeError:
+                    return False, None
+
+        return True, coerce(obj)
+
+
+def _parse_step(step: str) -> tp.Tuple[int, tp.Union[str, int]]:
+    if step.startswith("."):
+        key = step[1:]
+        return (_ITEM, int(key)) if key.isdigit() else (_ATTR, key)
+    key = step[1:-1].strip()
+    if key[0] in "'\"":
+        return _ITEM, key[1:-1]
+    return _ITEM, int(key)
+
+
+def simple_expression(
+    val: str, brackets: tp.Tuple[str, str]
+) -> tp.Optional[SimpleExpression]:
+    """
+    Returns SimpleExpression if the whole value is one trivial expression
+    """
+    key = (val, brackets)
+    expression = simple_cache.get(key)
+    if expression is None:
+        expression = _parse(val, brackets)
+        simple_cache.set(key, expression)
+    return None if expression is _not_simple else expression
+
+
+def _parse(val: str, brackets: tp.Tuple[str, str]):
+    start, end = brackets
+    if not val.startswith(start) or not val.endswith(end):
+        return _not_simple
+    body = val[len(start) : -len(end)]
+    if start in body or end in body:
+        return _not_simple
+
+    if _CONSTANT_RE.fullmatch(body):
+        return SimpleExpression(None, constant=True)
+
+    match = _REFERENCE_RE.fullmatch(body)
+    if match is None or match.group(1) in _RESERVED:
+        return _not_simple
+    steps = tuple(_parse_step(s) for s in _STEP_RE.findall(match.group(2)))
+    return SimpleExpression(match.group(1), steps)
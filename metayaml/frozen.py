@@ -0,0 +1,126 @@
+import sys
+import typing as tp
+import weakref
+from collections.abc import Mapping
+
+
+class _Keys(object):
+    """
+    Keys of FrozenDict and their positions, shared by all dicts with the same keys
+    """
+
+    __slots__ = ("keys", "index", "__weakref__")
+
+    def __init__(self, keys: tp.Tuple):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+
+    def __reduce__(self):
+        return _keys, (self.keys,)
+
+
+# key tables of live FrozenDicts, keys are tuples of dict keys and their types,
+# so keys which are equal but of other types (1, 1.0 and True) get own tables
+_key_tables = weakref.WeakValueDictionary()
+
+
+def _keys(keys: tp.Tuple) -> _Keys:
+    table_key = (keys, tuple(map(type, keys)))
+    table = _key_tables.get(table_key)
+    if table is None:
+        table = _key_tables.setdefault(table_key, _Keys(keys))
+    return table
+
+
+def _frozen_dict(keys: _Keys, values: tp.Tuple) -> "FrozenDict":
+    result = FrozenDict.__new__(FrozenDict)
+    result._keys = keys
+    result._values = values
+    result._hash = None
+    return result
+
+
+class FrozenDict(Mapping):
+    """
+    Read-only hashable dict.
+
+    Keys are kept in a table shared by all FrozenDicts with the same keys, values in a tuple,
+    so many dicts of the same shape (list items, inherited sections) take little memory.
+    """
+
+    __slots__ = ("_keys", "_values", "_hash")
+
+    def __init__(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        self._keys = _keys(tuple(data))
+        self._values = tuple(data.values())
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._values[self._keys.index[key]]
+
+    def get(self, key, default=None):
+        i = self._keys.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys.index
+
+    def __iter__(self):
+        return iter(self._keys.keys)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, FrozenDict) and other._keys is self._keys:
+            return self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(frozenset(zip(self._keys.keys, self._values)))
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"FrozenDict({dict(zip(self._keys.keys, self._values))!r})"
+
+    def __reduce__(self):
+        return _frozen_dict, (self._keys, self._values)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def freeze(value, memo: tp.Optional[dict] = None):
+    """
+    Returns read-only copy of data: dicts are converted to FrozenDict, lists to tuples
+    and sets to frozensets, strings are interned. Containers shared by several places
+    are converted once.
+    """
+    if not isinstance(value, (dict, list, set)):
+        return _intern(value)
+
+    if memo is None:
+        memo = {}
+    result = memo.get(id(value))
+    if result is not None:
+        return result[1]
+
+    if isinstance(value, dict):
+        keys = _keys(tuple(freeze(k, memo) for k in value))
+        result = _frozen_dict(keys, tuple(freeze(v, memo) for v in value.values()))
+    elif isinstance(value, list):
+        result = tuple(freeze(v, memo) for v in value)
+    else:
+        result = frozenset(freeze(v, memo) for v in value)
+    # keep the source alive, so its id is not reused during conversion
+    memo[id(value)] = (value, result)
+    return result
@@ -0,0 +1,176 @@
+"""
+Flat index of the loaded config by key paths.
+
+Every dict, list and value of the data is stored by its path string in the format of
+MetaYamlExceptionPath, e.g. "loggers.backend.level" or "services[3].port", so looking a
+value up costs one dict lookup whatever the depth is. The index is built for lookups in
+the loaded data, expressions are evaluated during the load without it.
+"""
+
+import re
+import typing as tp
+from collections.abc import Mapping, Sequence
+
+from metayaml.exception import MetaYamlExceptionPath
+
+Path = tp.Union[str, tp.Tuple]
+
+_PART_RE = re.compile(r"\[(-?\d+)\]|\.?([^.\[\]]+)")
+
+_missing = object()
+
+
+def path_str(path: tp.Tuple) -> str:
+    return MetaYamlExceptionPath._path_to_str(path)
+
+
+def parse_path(path: str) -> tp.Tuple:
+    """
+    Returns path tuple of the path string, e.g. ("services", 3, "port") for "services[3].port"
+    """
+    parts = []
+    position = 0
+    while position < len(path):
+        match = _PART_RE.match(path, position)
+        if match is None:
+            raise KeyError(path)
+        index, key = match.groups()
+        parts.append(int(index) if index is not None else key)
+        position = match.end()
+    return tuple(parts)
+
+
+def _join(parent: str, key) -> str:
+    if isinstance(key, str):
+        return f"{parent}.{key}" if parent else key
+    return f"{parent}[{key}]"
+
+
+def _children(value) -> tp.Iterable[tp.Tuple[tp.Any, tp.Any]]:
+    if isinstance(value, Mapping):
+        return value.items()
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return enumerate(value)
+    return ()
+
+
+class PathIndex(object):
+    """
+    Index of all values of the data by path strings.
+
+    The index is kept up to date by set(), delete() and extend(). If the data is changed
+    directly, rebuild() should be called.
+
+    :param data     The config data
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._index: tp.Dict[str, tp.Any] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        self._index.clear()
+        self._add("", self.data)
+
+    def _add(self, path: str, value):
+        stack = [(path, value)]
+        while stack:
+            path, value = stack.pop()
+            self._index[path] = value
+            stack.extend((_join(path, key), child) for key, child in _children(value))
+
+    def _remove(self, path: str, value):
+        stack = [(path, value)]
+        while stack:
+            path, value = stack.pop()
+            self._index.pop(path, None)
+            stack.extend((_join(path, key), child) for key, child in _children(value))
+
+    def get(self, path: Path, default=None):
+        """
+        Returns the value by path string like "services[3].port" or path tuple
+        like ("services", 3, "port")
+        """
+        if isinstance(path, str):
+            return self._index.get(path, default)
+        return self._index.get(path_str(path), default)
+
+    def get_many(self, paths: tp.Iterable[Path], default=None) -> tp.List:
+        """
+        Returns the values of paths, default for not existed paths
+        """
+        return [self.get(path, default) for path in paths]
+
+    def __contains__(self, path: Path) -> bool:
+        return self.get(path, _missing) is not _missing
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _parent(self, path: Path) -> tp.Tuple[tp.Any, tp.Any, str]:
+        parts = parse_path(path) if isinstance(path, str) else tuple(path)
+        if not parts:
+            raise KeyError("the root can't be changed")
+        parent_path = path_str(parts[:-1])
+        parent = self._index.get(parent_path, _missing)
+        if parent is _missing:
+            raise KeyError(parent_path)
+        return parent, parts[-1], parent_path
+
+    def set(self, path: Path, value):
+        """
+        Sets the value, the parent dict or list should exist
+        """
+        parent, key, parent_path = self._parent(path)
+        if isinstance(parent, list):
+            self._reindex(parent_path, parent, lambda: parent.__setitem__(key, value))
+            return
+        child_path = _join(parent_path, key)
+        if key in parent:
+            self._remove(child_path, parent[key])
+        parent[key] = value
+        self._add(child_path, value)
+
+    def merge(self, path: Path, values: Mapping):
+        """
+        Merges values into the dict by path: nested dicts are merged, other values replaced
+        """
+        parts = parse_path(path) if isinstance(path, str) else tuple(path)
+        target = self.get(parts)
+        if not isinstance(target, dict):
+            raise KeyError(f"{path_str(parts)} is not a dict")
+        for key, value in values.items():
+            if isinstance(value, Mapping) and isinstance(target.get(key), dict):
+                self.merge(parts + (key,), value)
+            else:
+                self.set(parts + (key,), value)
+
+    def delete(self, path: Path):
+        """
+        Removes the value from its dict or list
+        """
+        parent, key, parent_path = self._parent(path)
+        if isinstance(parent, list):
+            self._reindex(parent_path, parent, lambda: parent.__delitem__(key))
+            return
+        self._remove(_join(parent_path, key), parent.pop(key))
+
+    def extend(self, path: Path, values: tp.Iterable):
+        """
+        Adds values to the end of the list
+        """
+        target = self.get(path)
+        if not isinstance(target, list):
+            raise KeyError(f"{path} is not a list")
+        start = len(target)
+        target.extend(values)
+        list_path = path if isinstance(path, str) else path_str(path)
+        for index in range(start, len(target)):
+            self._add(_join(list_path, index), target[index])
+
+    def _reindex(self, path: str, value: list, change: tp.Callable):
+        # indexes of list items can be shifted, the whole list is indexed again
+        self._remove(path, value)
+        change()
+        self._add(path, value)
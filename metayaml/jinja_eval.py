@@ -1,7 +1,19 @@
+import marshal
+import time
+import typing as tp
+from collections.abc import Mapping
+from functools import lru_cache
+from types import CodeType
+
 import jinja2
-from jinja2.compiler import CodeGenerator as _CodeGenerator, Frame
 from jinja2 import nodes
+from jinja2.compiler import CodeGenerator as _CodeGenerator
+from jinja2.compiler import Frame
+
+from metayaml.cache import LRUCache, template_cache
 from metayaml.exception import MetaYamlExceptionPath
+from metayaml.fast_eval import coerce
+from metayaml.profile import COMPILE, RENDER
 
 
 class CodeGenerator(_CodeGenerator):
@@ -28,26 +40,192 @@ class Template(jinja2.Template):
     environment_class = Environment
 
 
+@lru_cache(maxsize=None)
+def _environment(brackets: tp.Tuple[str, str], undefined: type) -> Environment:
+    return Environment(
+        variable_start_string=brackets[0],
+        variable_end_string=brackets[1],
+        undefined=undefined,
+    )
+
+
+def undefined_class(ignore_errors: bool) -> type:
+    return jinja2.Undefined if ignore_errors else jinja2.StrictUndefined
+
+
+def compile_template(
+    val: str, brackets: tp.Tuple[str, str], undefined: type
+) -> CodeType:
+    return _environment(brackets, undefined).compile(val)
+
+
+def template_from_code(
+    code: CodeType, brackets: tp.Tuple[str, str], undefined: type
+) -> Template:
+    env = _environment(brackets, undefined)
+    return Template.from_code(env, code, env.make_globals(None))
+
+
+def dump_templates(
+    expressions: tp.Iterable[tp.Tuple[str, tp.Tuple[str, str]]], ignore_errors: bool
+) -> tp.List[tp.Tuple[str, tp.Tuple[str, str], tp.Optional[bytes]]]:
+    """
+    Returns (expression, brackets, marshaled code) of the expressions, the code is None
+    when the expression can't be compiled: the error is raised (or ignored) on render
+    """
+    undefined = undefined_class(ignore_errors)
+    result = []
+    for val, brackets in expressions:
+        try:
+            code = marshal.dumps(compile_template(val, brackets, undefined))
+        except Exception:
+            code = None
+        result.append((val, brackets, code))
+    return result
+
+
+def load_templates(
+    templates: tp.Iterable[tp.Tuple[str, tp.Tuple[str, str], tp.Optional[bytes]]],
+    ignore_errors: bool,
+):
+    """
+    Puts templates of the result of dump_templates to template_cache
+    """
+    undefined = undefined_class(ignore_errors)
+    for val, brackets, code in templates:
+        key = (val, brackets, undefined)
+        if code is not None and key not in template_cache:
+            template = template_from_code(marshal.loads(code), brackets, undefined)
+            template_cache.set(key, template)
+
+
+# key paths referenced by expressions, keys are (expression, brackets)
+reference_cache = LRUCache(maxsize=4096)
+
+
+def template_references(
+    val: str, brackets: tp.Tuple[str, str]
+) -> tp.Tuple[tp.Tuple, ...]:
+    """
+    Returns key paths which the expression refers to, e.g. ("db", "hosts", 0) for
+    ${db.hosts[0]}. A path ends before the first key which is not constant, the
+    expression may use any value under it.
+    """
+    key = (val, brackets)
+    references = reference_cache.get(key)
+    if references is None:
+        try:
+            ast = _environment(brackets, jinja2.StrictUndefined).parse(val)
+        except jinja2.TemplateSyntaxError:
+            references = ()  # the error is raised on compiling
+        else:
+            found: tp.List[tp.Tuple] = []
+            _collect_references(ast, found)
+            references = tuple(dict.fromkeys(found))
+        reference_cache.set(key, references)
+    return references
+
+
+def _reference(node: nodes.Node) -> tp.Optional[tp.Tuple]:
+    if isinstance(node, nodes.Name):
+        return (node.name,) if node.ctx == "load" else None
+    if isinstance(node, nodes.Getattr):
+        base = _reference(node.node)
+        return None if base is None else base + (node.attr,)
+    if isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const):
+        base = _reference(node.node)
+        return None if base is None else base + (node.arg.value,)
+    return None
+
+
+def _collect_references(node: nodes.Node, found: tp.List[tp.Tuple]):
+    reference = _reference(node)
+    if reference is not None:
+        found.append(reference)
+        return
+    for child in node.iter_child_nodes():
+        _collect_references(child, found)
+
+
+class RenderContext(Mapping):
+    """
+    Read-only view of the loaded data used as template context.
+
+    The view looks values up in the live data dict, so rendering an expression
+    does not depend on the number of keys loaded so far. Templates refer to keys
+    by name, so keys which are not strings are visible as str(key).
+    """
+
+    __slots__ = ("data", "globals")
+
+    def __init__(self, data: dict, globals: tp.Mapping):
+        self.data = data
+        self.globals = globals
+
+    def __getitem__(self, key):
+        try:
+            return self.data[key]
+        except KeyError:
+            pass
+        try:
+            return self.globals[key]
+        except KeyError:
+            return self.data[self._data_key(key)]
+
+    def _data_key(self, name):
+        # the key of data which is not a string, but is named so in templates
+        for key in self.data:
+            if not isinstance(key, str) and str(key) == name:
+                return key
+        raise KeyError(name)
+
+    def __contains__(self, key) -> bool:
+        if key in self.data or key in self.globals:
+            return True
+        try:
+            self._data_key(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        keys = [str(k) for k in self.data]
+        keys.extend(k for k in self.globals if k not in self.data)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(self.data) + sum(1 for k in self.globals if k not in self.data)
+
+
 def jinja_eval_value(loader, val, path, data, eager, brackets):
-    cache = loader.cache_template[eager]
-    t = cache.get(val)
-    undefined = jinja2.Undefined if loader.ignore_errors else jinja2.StrictUndefined
+    profile = loader.profile
+    undefined = undefined_class(loader.ignore_errors)
+    key = (val, brackets, undefined)
+    t = template_cache.get(key)
+    if profile is not None:
+        if t is None:
+            profile.template_misses += 1
+        else:
+            profile.template_hits += 1
     if t is None:
+        if profile is not None:
+            started = time.perf_counter()
         try:
-            t = Template(
-                val,
-                variable_start_string=brackets[0],
-                variable_end_string=brackets[1],
-                undefined=undefined,
-            )
+            code = compile_template(val, brackets, undefined)
+            t = template_from_code(code, brackets, undefined)
         except Exception as e:
             if not loader.ignore_errors:
                 raise MetaYamlExceptionPath(f"Template compiling error: {e}", path, val)
-        cache[val] = t
+        else:
+            template_cache.set(key, t)
+        if profile is not None:
+            profile.record(COMPILE, path, time.perf_counter() - started)
 
+    if profile is not None:
+        started = time.perf_counter()
     try:
-        data_str_key = {str(k): v for k, v in data.items()}
-        rendered = list(t.root_render_func(t.new_context(data_str_key)))
+        context = t.new_context(RenderContext(data, t.globals), shared=True)
+        rendered = list(t.root_render_func(context))
         if len(rendered) == 1:
             if isinstance(rendered[0], undefined) and not loader.ignore_errors:
                 raise MetaYamlExceptionPath("Incorrect template", path, val)
@@ -62,12 +240,6 @@ def jinja_eval_value(loader, val, path, data, eager, brackets):
         if not loader.ignore_errors:
             raise MetaYamlExceptionPath(f"Render template error: {e}", path, val)
 
-    if isinstance(result, str):
-        for t in [int, float]:
-            try:
-                result = t(result)
-                break
-            except (ValueError, TypeError):
-                pass
-
-    return result
+    if profile is not None:
+        profile.record(RENDER, path, time.perf_counter() - started, fast=False)
+    return coerce(result)
@@ -0,0 +1,198 @@
+"""
+Evaluation of lazy $(...) values on first access.
+
+LazyDict and LazyList wrap the merged data, evaluate lazy values and keys of a
+container when it is accessed and keep the results, so the cost of lazy evaluation
+is proportional to the values which are really used.
+"""
+
+import typing as tp
+from collections import ChainMap
+from collections.abc import Mapping, MutableMapping, MutableSequence, Sequence
+from copy import deepcopy
+
+Path = tp.Tuple
+
+
+class _Evaluator(object):
+    """
+    Evaluation state shared by all containers of one config
+    """
+
+    __slots__ = ("loader", "global_data", "in_progress")
+
+    def __init__(self, loader, global_data: tp.Optional[Mapping] = None):
+        self.loader = loader
+        self.global_data = global_data
+        self.in_progress: tp.Set[tp.Tuple[int, tp.Any]] = set()
+
+    def wrap(self, value, path: Path):
+        if isinstance(value, dict):
+            return LazyDict(self, value, path)
+        if isinstance(value, list):
+            return LazyList(self, value, path)
+        return value
+
+    def evaluate(self, container, key, path: Path):
+        value = container[key]
+        if not isinstance(value, str):
+            return self.wrap(value, path)
+
+        marker = (id(container), key)
+        if marker in self.in_progress:
+            # the value refers to itself, like in full evaluation it is seen unevaluated
+            return value
+        self.in_progress.add(marker)
+        try:
+            result = self.loader.eval_value(value, path, self.global_data, False)
+        finally:
+            self.in_progress.discard(marker)
+        return self.wrap(result, path)
+
+
+class LazyDict(MutableMapping):
+    """
+    Dict which evaluates lazy values on first access
+    """
+
+    __slots__ = ("_evaluator", "_data", "_path", "_keys_ready", "_ready")
+
+    def __init__(self, evaluator: _Evaluator, data: dict, path: Path = ()):
+        self._evaluator = evaluator
+        self._data = data
+        self._path = path
+        self._keys_ready = False
+        self._ready: tp.Set = set()
+
+    def _prepare_keys(self):
+        if self._keys_ready:
+            return
+        self._keys_ready = True
+        loader = self._evaluator.loader
+        for key, value in list(self._data.items()):
+            evaluated_key = loader.eval_value(
+                key, self._path + (str(key),), self._evaluator.global_data, False
+            )
+            if evaluated_key != key:
+                self._data.pop(key)
+                self._data[evaluated_key] = value
+
+    def __getitem__(self, key):
+        self._prepare_keys()
+        if key not in self._ready:
+            value = self._evaluator.evaluate(self._data, key, self._path + (str(key),))
+            self._data[key] = value
+            self._ready.add(key)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._prepare_keys()
+        self._data[key] = value
+        self._ready.add(key)
+
+    def __delitem__(self, key):
+        self._prepare_keys()
+        del self._data[key]
+        self._ready.discard(key)
+
+    def __contains__(self, key) -> bool:
+        self._prepare_keys()
+        return key in self._data
+
+    def __iter__(self):
+        self._prepare_keys()
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        self._prepare_keys()
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"LazyDict({self._data!r})"
+
+    def __deepcopy__(self, memo):
+        return deepcopy(self.materialize(), memo)
+
+    def materialize(self) -> dict:
+        """
+        Evaluates all values and returns plain dict
+        """
+        return {key: materialize(value) for key, value in self.items()}
+
+
+class LazyList(MutableSequence):
+    """
+    List which evaluates lazy values on first access
+    """
+
+    __slots__ = ("_evaluator", "_data", "_path", "_ready")
+
+    def __init__(self, evaluator: _Evaluator, data: list, path: Path = ()):
+        self._evaluator = evaluator
+        self._data = data
+        self._path = path
+        self._ready: tp.List[bool] = [False] * len(data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._data)))]
+        if index < 0:
+            index += len(self._data)
+        if not 0 <= index < len(self._data):
+            raise IndexError("list index out of range")
+        if not self._ready[index]:
+            value = self._evaluator.evaluate(self._data, index, self._path + (index,))
+            self._data[index] = value
+            self._ready[index] = True
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        self._data[index] = value
+        self._ready[index] = True
+
+    def __delitem__(self, index):
+        del self._data[index]
+        del self._ready[index]
+
+    def insert(self, index, value):
+        self._data.insert(index, value)
+        self._ready.insert(index, True)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"LazyList({self._data!r})"
+
+    def __deepcopy__(self, memo):
+        return deepcopy(self.materialize(), memo)
+
+    def materialize(self) -> list:
+        """
+        Evaluates all values and returns plain list
+        """
+        return [materialize(value) for value in self]
+
+
+def materialize(value):
+    """
+    Evaluates all lazy values and returns plain dicts and lists
+    """
+    if isinstance(value, (LazyDict, LazyList)):
+        return value.materialize()
+    return value
+
+
+def lazy_data(loader, data: dict, hidden: tp.Optional[dict] = None) -> LazyDict:
+    """
+    Wraps merged data, hidden values are available in expressions but not in the data
+    """
+    evaluator = _Evaluator(loader)
+    root = LazyDict(evaluator, data, ("#",))
+    evaluator.global_data = ChainMap(root, hidden) if hidden else root
+    return root
@@ -1,17 +1,65 @@
-import os
-import yaml
 import datetime
+import itertools
+import os
+import time
 import typing as tp
-from copy import deepcopy
-from collections import defaultdict
 from collections.abc import Iterable, MutableMapping
 from copy import deepcopy
+from functools import lru_cache
 from glob import glob
-from collections.abc import MutableMapping, Iterable
-from metayaml.exception import MetaYamlException, FileNotFound, MetaYamlExceptionPath
+from types import ModuleType
+
+from metayaml import frozen, topological
+from metayaml.cache import FileCache, copy_tree, fingerprint, read_document
+from metayaml.exception import FileNotFound, MetaYamlException, MetaYamlExceptionPath
+from metayaml.fast_eval import simple_expression
+from metayaml.index import PathIndex, parse_path
+from metayaml.lazy import lazy_data
+from metayaml.profile import INHERIT, LAZY, MERGE, PARSE, RENDER
+from metayaml.stream import stream_document
+
+if tp.TYPE_CHECKING:
+    from concurrent.futures import Executor
 
 Path = tp.Tuple
 
+# stands for the cp method of the loader in checkpoint snapshots
+_LOADER_CP = object()
+
+
+def _loader_class(loader: tp.Union[str, type]) -> type:
+    """
+    Returns yaml loader class for loader mode.
+
+    "full" and "safe" prefer the libyaml based loader when PyYAML is built with it,
+    "full_python" and "safe_python" always use the pure python implementation.
+    """
+    if not isinstance(loader, str):
+        return loader
+
+    import yaml
+
+    if loader == "full":
+        return getattr(yaml, "CFullLoader", yaml.FullLoader)
+    if loader == "safe":
+        return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    if loader == "full_python":
+        return yaml.FullLoader
+    if loader == "safe_python":
+        return yaml.SafeLoader
+    raise MetaYamlException(f"Unknown yaml loader {loader!r}")
+
+
+@lru_cache(maxsize=None)
+def _jinja_eval() -> ModuleType:
+    """
+    Returns the jinja_eval module, jinja is imported by the first expression which
+    can't be evaluated without it
+    """
+    from metayaml import jinja_eval
+
+    return jinja_eval
+
 
 def _path(path: Path, key: tp.Union[str, int], index=False):
     if not index:
@@ -50,6 +98,17 @@ class MetaYaml(object):
         extend_key_word="extend",
         ignore_errors=False,
         ignore_not_existed_files=False,
+        loader: tp.Union[str, type] = "full",
+        file_cache: tp.Optional[FileCache] = None,
+        checkpoints=None,
+        copy_on_write=False,
+        freeze=False,
+        executor: tp.Optional["Executor"] = None,
+        lazy=False,
+        profile=None,
+        stream=False,
+        evaluation="ordered",
+        only=None,
     ):
         """
         Reads and process yaml config files
@@ -60,16 +119,87 @@ class MetaYaml(object):
         :param extend_key_word  The name of section with list of included files
         :param ignore_errors  Do not rise exception when value can't be rendered
         :param ignore_not_existed_files Do not rise exception if the file not found
+        :param loader         yaml loader: "full", "safe", "full_python", "safe_python" or loader class
+        :param file_cache     FileCache instance to reuse parsed files between reads
+        :param checkpoints    Checkpoints instance to reuse merged data of common file sequences
+        :param copy_on_write  Share unchanged subtrees between inherit/cp copies and their source
+        :param freeze         Return read-only data (FrozenDict and tuples instead of dict and list)
+        :param executor       Thread or process pool executor to read and parse included files in parallel
+        :param lazy           Evaluate $() values on first access, the data is LazyDict
+        :param profile        metayaml.profile.Profile instance to record timings of loading
+        :param stream         Parse and merge files by top level keys without building the whole
+                              document, the extend key should be the first key of a file
+        :param evaluation     "ordered" - expressions are evaluated in order of the files and values,
+                              "topological" - after the values they refer to
+        :param only           Key path or key paths like "db" or "services.api" to keep in the result, other
+                              top level sections are merged only if expressions refer to them, so
+                              errors in other sections are not raised. The defaults dict is not
+                              changed in this mode
         """
 
         self._extend_key_word = extend_key_word
         self.data = defaults or {}
-        self.data["cp"] = self.cp
 
-        self.cache_template = defaultdict(lambda: {})
+        # containers shared by several places of the data, they are copied before change
+        self._shared: tp.Optional[tp.Dict[int, tp.Any]] = {} if copy_on_write else None
+        self._cp = self._shared_cp if copy_on_write else self.cp
+
         self.ignore_errors = ignore_errors
+        self.profile = profile
+        self.stream = stream
+        self._topological: tp.Optional[topological.Resolver] = None
+        if evaluation == "topological":
+            if lazy or checkpoints is not None:
+                raise MetaYamlException(
+                    "topological evaluation can't be used with lazy or checkpoints"
+                )
+            self._topological = topological.Resolver(self)
+        elif evaluation != "ordered":
+            raise MetaYamlException(f"Unknown evaluation mode {evaluation!r}")
+        # top level sections which are not kept are not merged, keys are section names,
+        # values are their sources: ({key: value}, path). When an expression refers to
+        # a skipped section, it is added to needed and the files are merged again
+        self._only = _prefix_tree(only) if only is not None else None
+        self._skipped: tp.Optional[tp.Dict[tp.Any, tp.List[tp.Tuple[dict, Path]]]] = (
+            None
+        )
+        self._needed: tp.Set = set()
+        self._final = False
+        if self._only is not None:
+            if lazy or checkpoints is not None:
+                raise MetaYamlException("only can't be used with lazy or checkpoints")
+            self._skipped = {}
+        if stream and (file_cache is not None or checkpoints is not None or executor):
+            raise MetaYamlException(
+                "stream can't be used with file_cache, checkpoints or executor"
+            )
         self.ignore_not_existed_files = ignore_not_existed_files
+        self.loader = _loader_class(loader)
+        self.file_cache = file_cache
+        self.executor = executor
+        self._check_hash = file_cache is not None and file_cache.check_hash
+        self._prefetched: tp.Dict[str, tp.Any] = {}
         self.processed_files = set()
+        self.file_stamps: tp.Dict[str, tp.Tuple] = {}
+        self.include_graph: tp.Dict[str, tp.List[str]] = {}
+        self.globs: tp.Dict[str, tp.List[str]] = {}
+        # parsed documents for merging the files again
+        self._documents: tp.Optional[tp.Dict[str, tp.Tuple[tp.Tuple, tp.Any]]] = (
+            {} if self._only is not None and not stream else None
+        )
+
+        self.checkpoints = checkpoints
+        self._replay: tp.Optional[tp.Tuple[tp.Optional[dict], list]] = None
+        if checkpoints is not None:
+            self._merge_key = (
+                fingerprint(self.data),
+                extend_key_word,
+                ignore_errors,
+                ignore_not_existed_files,
+                self.loader,
+                copy_on_write,
+            )
+            self._replay = (None, [])
 
         if isinstance(yaml_file, str):
             yaml_file = [yaml_file]
@@ -78,14 +208,144 @@ class MetaYaml(object):
                 yaml_file, Iterable
             ), "yaml_file should be string or list of strings"
 
+        if self._only is not None:
+            self._load_only(list(yaml_file))
+        else:
+            self.data["cp"] = self._cp
+            self._load_all(yaml_file, lazy, freeze)
+        self._shared = None
+        if freeze:
+            self.data = frozen.freeze(self.data)
+        self._index: tp.Optional[PathIndex] = None
+
+    def _load_all(self, yaml_file: tp.Iterable[str], lazy: bool, freeze: bool):
         files = self.extend_filename(yaml_file)
+        self._prefetch(files)
         for filename in files:
             self.load(filename, self.data)
+        self._prefetched.clear()
+        self._restore_checkpoint(self.data)
+        if self.checkpoints is not None:
+            self.checkpoints.record(self._merge_key)
+
+        if lazy:
+            self.data.pop(self._extend_key_word, None)
+            hidden = {"cp": self._cp}
+            if self.data.get("cp") == self._cp:
+                del self.data["cp"]
+            self.data = lazy_data(self, self.data, hidden)
+            if freeze:
+                self.data = self.data.materialize()
+        else:
+            if self.profile is not None:
+                started = time.perf_counter()
+            self._final = True
+            if self._topological is not None:
+                self._topological.finish(self.data, ("#",))
+            else:
+                self.process_lazy(self.data, self.data, ("#",))
+            if self.profile is not None:
+                self.profile.record(LAZY, "", time.perf_counter() - started)
+            self.data.pop(self._extend_key_word, None)
+            if self.data.get("cp") == self._cp:
+                del self.data["cp"]
+
+    def _load_only(self, yaml_file: tp.List[str]):
+        # the files are merged into a copy, the defaults dict of the caller isn't changed
+        defaults = self.data
+        while True:
+            self.data = copy_tree(defaults)
+            self._skipped = {}
+            self.data["cp"] = self._cp
+            try:
+                self._load_all(yaml_file, False, False)
+                break
+            except _SkippedSection as e:
+                # merged in its place of the files, so its values are the same as in
+                # the whole config
+                self._needed.update(e.names)
+            self._final = False
+            self._prefetched.clear()
+            self.processed_files.clear()
+            self.file_stamps.clear()
+            self.include_graph.clear()
+            self.globs.clear()
+            if self._shared is not None:
+                self._shared.clear()
+            if self._topological is not None:
+                self._topological = topological.Resolver(self)
+        self.data = _project(self.data, self._only)
+        self._skipped = None
+        self._documents = None
+
+    @property
+    def index(self) -> PathIndex:
+        """
+        Index of the loaded data by key paths for lookups after the load, it is built
+        on first use. set(), delete(), merge() and extend() keep it up to date, after
+        changing the data directly index.rebuild() should be called
+        """
+        if self._index is None or self._index.data is not self.data:
+            self._index = PathIndex(self.data)
+        return self._index
 
-        self.process_lazy(self.data, self.data, ("#",))
-        self.data.pop(self._extend_key_word, None)
-        if self.data["cp"] == self.cp:
-            del self.data["cp"]
+    def get(self, path: tp.Union[str, Path], default=None):
+        """
+        Returns the value by key path like "services[3].port" or ("services", 3, "port")
+        """
+        return self.index.get(path, default)
+
+    def get_many(
+        self, paths: tp.Iterable[tp.Union[str, Path]], default=None
+    ) -> tp.List:
+        """
+        Returns the values of key paths, default for not existed paths
+        """
+        return self.index.get_many(paths, default)
+
+    def set(self, path: tp.Union[str, Path], value):
+        """
+        Sets the value by key path, the parent dict or list should exist
+        """
+        self.index.set(path, value)
+
+    def delete(self, path: tp.Union[str, Path]):
+        """
+        Removes the value by key path
+        """
+        self.index.delete(path)
+
+    def merge(self, path: tp.Union[str, Path], values: dict):
+        """
+        Merges values into the dict by key path
+        """
+        self.index.merge(path, values)
+
+    def extend(self, path: tp.Union[str, Path], values: tp.Iterable):
+        """
+        Adds values to the end of the list by key path
+        """
+        self.index.extend(path, values)
+
+    def _shared_cp(self, source: tp.Union[dict, list, tuple], *args, **kwargs):
+        if isinstance(source, MutableMapping):
+            result = self._copy(source)
+            for arg in args:
+                result.update(arg)
+            result.update(kwargs)
+            return result
+        return self.cp(source, *args, **kwargs)
+
+    def _copy(self, value: dict) -> dict:
+        if self._shared is None:
+            return deepcopy(value)
+
+        # copy on write: the children of the copy are shared with the source
+        result = dict(value)
+        for child in result.values():
+            if isinstance(child, (dict, list)):
+                self._shared[id(child)] = child
+        return result
 
     def extend_filename(self, file_list: tp.List[str], path: tp.Optional[str] = None):
         files = []
@@ -96,59 +356,248 @@ class MetaYaml(object):
             if not os.path.isabs(filename):
                 filename = os.path.join(path, filename)
 
-            found_files = glob(filename)
+            found_files = self._glob(filename)
             if not self.ignore_not_existed_files and not found_files:
                 raise FileNotFound(f"File {filename} not found")
             found_files.sort()
+            self.globs[filename] = found_files
             files.extend(found_files)
 
         return files
 
+    def _glob(self, pattern: str) -> tp.List[str]:
+        return glob(pattern)
+
     def load(self, file_path: str, data: dict):
         if file_path in self.processed_files:
             return data  # file was already processed
 
         self.processed_files.add(file_path)
         key_path = (os.path.basename(file_path),)
-        file_dir = os.path.dirname(file_path)
+        if self.stream:
+            return self._load_stream(file_path, data, key_path)
 
-        with open(file_path, "rb") as f:
-            file_data = yaml.load(f, yaml.FullLoader) or {}
-            assert isinstance(file_data, dict)
+        if self.profile is not None:
+            started = time.perf_counter()
+        file_data = self._read_document(file_path) or {}
+        if self.profile is not None:
+            self.profile.record(PARSE, file_path, time.perf_counter() - started)
+        assert isinstance(file_data, dict)
 
         extends = file_data.pop(self._extend_key_word, [])
-        if extends:
-            extends = self.eval(
-                extends, data, key_path + (self._extend_key_word,), eager=True
+        self._load_extends(file_path, extends, data)
+
+        if self.profile is not None:
+            started = time.perf_counter()
+        data = self._merge_file(file_path, file_data, data, key_path)
+        if self.profile is not None:
+            self.profile.record(MERGE, file_path, time.perf_counter() - started)
+        return data
+
+    def _load_stream(self, file_path: str, data: dict, key_path: Path):
+        if self.profile is not None:
+            started = time.perf_counter()
+        self.include_graph[file_path] = []
+        stamp, entries = stream_document(file_path, self.loader)
+        first = next(entries, None)
+        if first is not None and first[0] == self._extend_key_word:
+            # the file is closed while the extended files are loaded, so a chain of
+            # extends doesn't keep a file open on every level
+            entries.close()
+            self._load_extends(file_path, first[1], data)
+            if self.profile is not None:
+                started = time.perf_counter()
+            stamp, entries = stream_document(file_path, self.loader)
+            next(entries, None)
+        elif first is not None:
+            entries = itertools.chain([first], entries)
+        self.file_stamps[file_path] = stamp
+
+        # top level inherit and del_all keys, they are applied before other keys
+        # like in a document merged as a whole
+        markers: tp.Dict[str, tp.Any] = {}
+        target = None
+        seen = set()
+        for key, value in entries:
+            if key in seen:
+                # a document keeps the last value of a duplicated key, but the first
+                # one is already merged
+                raise MetaYamlExceptionPath(
+                    f"duplicated key {key!r} in stream mode", key_path + (key,), value
+                )
+            seen.add(key)
+            if key == self._extend_key_word:
+                raise MetaYamlExceptionPath(
+                    f"{key} should be the first key in stream mode",
+                    key_path + (key,),
+                    value,
+                )
+            elif key in (self.INHERIT_MARKER, self.DEL_ALL_MARKER):
+                if target is not None:
+                    raise MetaYamlExceptionPath(
+                        f"{key} should be before other keys in stream mode",
+                        key_path + (key,),
+                        value,
+                    )
+                markers[key] = value
+            else:
+                if target is None:
+                    target = self._stream_target(markers, data, key_path)
+                self.merge_data({key: value}, target, data, key_path)
+        if target is None:
+            target = self._stream_target(markers, data, key_path)
+        if target is not data:
+            self._merge_dict(target, data, data, key_path)
+        if self.profile is not None:
+            duration = time.perf_counter() - started
+            self.profile.record(MERGE, file_path, duration, stream=True)
+        return data
+
+    def _stream_target(self, markers: dict, data: dict, key_path: Path) -> dict:
+        # the dict which the keys of a streamed file are merged into
+        target = data
+        inherit = markers.get(self.INHERIT_MARKER)
+        if inherit:
+            target = self._inherited(inherit, data, key_path)
+        if self.DEL_ALL_MARKER in markers:
+            del_all = {self.DEL_ALL_MARKER: markers[self.DEL_ALL_MARKER]}
+            self._merge_dict(del_all, target, data, key_path)
+        return target
+
+    def _load_extends(self, file_path: str, extends, data: dict):
+        key_path = (os.path.basename(file_path),)
+        file_dir = os.path.dirname(file_path)
+        self.include_graph[file_path] = []
+        if not extends:
+            return
+
+        if self._has_expression(extends, self.eager_brackets):
+            self._restore_checkpoint(data)
+        extends = self.eval(
+            extends, data, key_path + (self._extend_key_word,), eager=True
+        )
+        if self._topological is not None:
+            extends = self._topological.evaluated(extends, data, key_path)
+        if isinstance(extends, str):
+            extends = [extends]
+
+        if not isinstance(extends, list):
+            raise MetaYamlException(
+                "should be list of string or string",
+                key_path + (self._extend_key_word,),
+                extends,
             )
-            if isinstance(extends, str):
-                extends = [extends]
 
-            if not isinstance(extends, list):
+        for file_name in extends:
+            if not isinstance(file_name, str):
                 raise MetaYamlException(
                     "should be list of string or string",
                     key_path + (self._extend_key_word,),
                     extends,
                 )
 
-            for file_name in extends:
-                if not isinstance(file_name, str):
-                    raise MetaYamlException(
-                        "should be list of string or string",
-                        key_path + (self._extend_key_word,),
-                        extends,
-                    )
+        self.include_graph[file_path] = self.extend_filename(extends, file_dir)
+        self._prefetch(self.include_graph[file_path])
+        for file_name in self.include_graph[file_path]:
+            try:
+                self.load(file_name, data)
+            except IOError as e:
+                raise FileNotFound(
+                    f"Open file '{file_name}' error from {file_path}: {e}"
+                )
 
-            for file_name in self.extend_filename(extends, file_dir):
-                try:
-                    self.load(file_name, data)
-                except IOError as e:
-                    raise FileNotFound(
-                        f"Open file '{file_name}' error from {file_path}: {e}"
-                    )
+    def _prefetch(self, files: tp.List[str]):
+        if self.executor is None:
+            return
 
-        data = self.merge_data(file_data, data, data, key_path)
-        return data
+        for file_path in files:
+            if file_path in self.processed_files or file_path in self._prefetched:
+                continue
+            if self.file_cache is not None:
+                found = self.file_cache.lookup(file_path, self.loader)
+                if found is not None:
+                    self._prefetched[file_path] = found
+                    continue
+            self._prefetched[file_path] = self.executor.submit(
+                read_document, file_path, self.loader, self._check_hash
+            )
+
+    def _read_document(self, file_path: str):
+        if self._documents is not None and file_path in self._documents:
+            stamp, document = self._documents[file_path]
+            self.file_stamps[file_path] = stamp
+            return copy_tree(document)
+
+        prefetched = self._prefetched.pop(file_path, None)
+        if prefetched is not None and not isinstance(prefetched, tuple):
+            stamp, document = prefetched.result()
+            if self.file_cache is not None:
+                self.file_cache.store(file_path, self.loader, stamp, document)
+                document = copy_tree(document)
+        elif prefetched is not None:
+            stamp, document = prefetched
+        elif self.file_cache is not None:
+            hits = self.file_cache.hits
+            stamp, document = self.file_cache.load_stamped(file_path, self.loader)
+            if self.profile is not None:
+                if self.file_cache.hits > hits:
+                    self.profile.file_cache_hits += 1
+                else:
+                    self.profile.file_cache_misses += 1
+        else:
+            stamp, document = read_document(file_path, self.loader)
+
+        self.file_stamps[file_path] = stamp
+        if self._documents is not None:
+            self._documents[file_path] = (stamp, copy_tree(document))
+        return document
+
+    def _merge_file(self, file_path: str, file_data: dict, data: dict, key_path: Path):
+        if self.checkpoints is None:
+            return self.merge_data(file_data, data, data, key_path)
+
+        key = (self._merge_key, (file_path, self.file_stamps[file_path]))
+        if self._replay is not None and self.checkpoints.is_known(key):
+            # the result of this merge is known, postpone it
+            self._merge_key = key
+            snapshot = self.checkpoints.snapshot(key)
+            if snapshot is not None:
+                self._replay = (snapshot, [])
+            else:
+                self._replay[1].append((file_data, key_path))
+            return data
+
+        self._restore_checkpoint(data)
+        if self.checkpoints.is_known(self._merge_key):
+            # the sequence of merged files differs from the known one here
+            snapshot = dict(data)
+            if snapshot.get("cp") == self._cp:
+                snapshot["cp"] = _LOADER_CP
+            self.checkpoints.save(self._merge_key, snapshot)
+        self.checkpoints.record(self._merge_key)
+        self._merge_key = key
+        return self.merge_data(file_data, data, data, key_path)
+
+    def _restore_checkpoint(self, data: dict):
+        if self._replay is None:
+            return
+
+        snapshot, postponed = self._replay
+        self._replay = None
+        if snapshot is not None:
+            data.clear()
+            data.update(copy_tree(snapshot))
+            if data.get("cp") is _LOADER_CP:
+                data["cp"] = self._cp
+        for file_data, key_path in postponed:
+            self.merge_data(file_data, data, data, key_path)
+
+    def _has_expression(self, value, brackets) -> bool:
+        if isinstance(value, str):
+            return brackets[0] in value
+        if isinstance(value, list):
+            return any(self._has_expression(v, brackets) for v in value)
+        return False
 
     def _eval_simple_data(
         self, value, global_data: dict, path: Path, eager: bool
@@ -173,35 +622,40 @@ class MetaYaml(object):
         assert isinstance(source, dict) and isinstance(dest, dict)
         inherit = source.pop(self.INHERIT_MARKER, None)
         if inherit:
-            target_path = path + (self.INHERIT_MARKER,)
-            target_dict = self.eval_value(
-                f"{self.eager_brackets[0]}{inherit}{self.eager_brackets[1]}",
-                target_path,
-                global_data,
-                True,
-            )
-            if not isinstance(target_dict, dict):
-                raise MetaYamlExceptionPath(
-                    f"inherit target should be dict, but it is {type(target_dict)}",
-                    target_path,
-                    inherit,
-                )
-
-            target_dict = deepcopy(target_dict)
+            target_dict = self._inherited(inherit, global_data, path)
             self._merge_dict(source, target_dict, global_data, path)
             source = target_dict
 
+        skipping = self._skipped is not None and dest is global_data
         if self.DEL_ALL_MARKER in source:
             source.pop(self.DEL_ALL_MARKER)
             dest.clear()
+            if skipping:
+                self._skipped.clear()
 
         for key, val in source.items():
             new_path = path + (str(key),)
             if val == self.DEL_MARKER:
                 dest.pop(key, None)
+                if skipping:
+                    self._skipped.pop(key, None)
                 continue
 
             new_key = self.eval_value(key, new_path, global_data, False)
+            if skipping and self._skip(new_key):
+                self._skipped.setdefault(new_key, []).append(({key: val}, path))
+                continue
+
+            if self._is_deferred(val):
+                dest[new_key] = topological.Deferred(
+                    val, new_path, True, dest.get(new_key, topological.MISSING)
+                )
+                self._topological.changed()
+                continue
+            if isinstance(val, topological.Deferred):
+                dest[new_key] = val  # value of inherited dict
+                self._topological.changed()
+                continue
 
             simple_data, evaluated_value = self._eval_simple_data(
                 val, global_data, new_path, eager=True
@@ -210,8 +664,15 @@ class MetaYaml(object):
                 dest[new_key] = evaluated_value
             else:
                 dest_value = dest.get(new_key)
+                if isinstance(dest_value, topological.Deferred):
+                    dest_value = self._topological.resolve(dest_value, global_data)
+                    dest[new_key] = dest_value
                 if dest_value:
+                    if self._shared is not None and id(dest_value) in self._shared:
+                        dest_value = dest[new_key] = self._unshare(dest_value)
                     self.merge_data(val, dest_value, global_data, path)
+                elif self._shared is not None and id(val) in self._shared:
+                    dest[new_key] = val  # unchanged subtree of inherited dict
                 else:
                     new_dest = None
                     if isinstance(
@@ -223,6 +684,66 @@ class MetaYaml(object):
                     )
         return dest
 
+    def _skip(self, key) -> bool:
+        if key in self._only or key in self._needed:
+            return False
+        return not (isinstance(key, str) and self.lazy_brackets[0] in key)
+
+    def _check_references(self, val: str, brackets: tp.Tuple[str, str]):
+        """
+        Raises _SkippedSection if the expression refers to skipped top level sections
+        """
+        expression = simple_expression(val, brackets)
+        if expression is not None:
+            names = () if expression.constant else (expression.name,)
+        else:
+            references = _jinja_eval().template_references(val, brackets)
+            names = [reference[0] for reference in references]
+        skipped = [name for name in names if name in self._skipped]
+        if skipped:
+            raise _SkippedSection(skipped)
+
+    def _inherited(self, inherit: str, global_data: dict, path: Path) -> dict:
+        """
+        Returns copy of the inherited dict
+        """
+        target_path = path + (self.INHERIT_MARKER,)
+        target_dict = self.eval_value(
+            f"{self.eager_brackets[0]}{inherit}{self.eager_brackets[1]}",
+            target_path,
+            global_data,
+            True,
+        )
+        if not isinstance(target_dict, dict):
+            raise MetaYamlExceptionPath(
+                f"inherit target should be dict, but it is {type(target_dict)}",
+                target_path,
+                inherit,
+            )
+
+        if self.profile is not None:
+            started = time.perf_counter()
+        target_dict = self._copy(target_dict)
+        if self.profile is not None:
+            self.profile.record(INHERIT, path, time.perf_counter() - started)
+        return target_dict
+
+    def _is_deferred(self, value) -> bool:
+        return (
+            self._topological is not None
+            and isinstance(value, str)
+            and self.eager_brackets[0] in value
+        )
+
+    def _unshare(self, value: tp.Union[dict, list]) -> tp.Union[dict, list]:
+        if isinstance(value, dict):
+            return self._copy(value)
+        result = list(value)
+        for child in result:
+            if isinstance(child, (dict, list)):
+                self._shared[id(child)] = child
+        return result
+
     def merge_data(self, source, dest, global_data: dict, path: Path):
         if isinstance(source, dict):
             if dest is None:
@@ -259,25 +780,49 @@ class MetaYaml(object):
                     f"list can't be merged to {type(dest)}", path, source
                 )
             dest.clear()
-            dest.extend(
-                self.eval(item, global_data, path + (key,), True)
-                for key, item in enumerate(source)
-            )
+            for key, item in enumerate(source):
+                if self._is_deferred(item):
+                    dest.append(topological.Deferred(item, path + (key,), True))
+                    self._topological.changed()
+                else:
+                    dest.append(self.eval(item, global_data, path + (key,), True))
             return dest
 
         return source
 
     def eval_value(self, val, path, global_data, eager):
-        from metayaml.jinja_eval import jinja_eval_value
-
         if not isinstance(val, str):
             return val
 
         brackets = self.eager_brackets if eager else self.lazy_brackets
         if brackets[0] not in val:
             return val
+        if self._skipped:
+            self._check_references(val, brackets)
+        if self._topological is not None:
+            self._topological.prepare(val, brackets, global_data)
+
+        expression = simple_expression(val, brackets)
+        if expression is not None:
+            if self.profile is not None:
+                started = time.perf_counter()
+            found, result = expression.resolve(global_data)
+            if found:
+                if self.profile is not None:
+                    duration = time.perf_counter() - started
+                    self.profile.record(RENDER, path, duration, fast=True)
+                return result
+            if expression.constant:
+                result = _jinja_eval().jinja_eval_value(
+                    self, val, path, global_data, eager, brackets
+                )
+                if not self.ignore_errors:
+                    expression.value = result
+                return result
 
-        return jinja_eval_value(self, val, path, global_data, eager, brackets)
+        return _jinja_eval().jinja_eval_value(
+            self, val, path, global_data, eager, brackets
+        )
 
     def eval_expression(
         self, data, global_data, path: Path, eager: bool
@@ -322,12 +867,66 @@ class MetaYaml(object):
         return self.eval_expression(data, global_data, path, False)
 
 
+class _SkippedSection(Exception):
+    """
+    An expression refers to skipped top level sections
+    """
+
+    def __init__(self, names: tp.List):
+        super().__init__(names)
+        self.names = names
+
+
+def _prefix_tree(paths: tp.Union[str, tp.Iterable[tp.Union[str, Path]]]) -> dict:
+    # nested dict of kept keys, None stands for the whole subtree
+    if isinstance(paths, str):
+        paths = [paths]
+    tree: dict = {}
+    for path in paths:
+        parts = parse_path(path) if isinstance(path, str) else tuple(path)
+        if not parts:
+            raise MetaYamlException("only should contain not empty key paths")
+        node = tree
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _project(data, tree: dict) -> dict:
+    # nested dicts are copied, they can be shared with other places of the data
+    result = {}
+    for key, subtree in tree.items():
+        if key not in data:
+            continue
+        value = data[key]
+        if subtree is None or not isinstance(value, dict):
+            result[key] = value
+        else:
+            result[key] = _project(value, subtree)
+    return result
+
+
 def read(
     yaml_file,
     defaults=None,
     extend_key_word="extend",
     ignore_errors=False,
     ignore_not_existed_files=False,
+    loader="full",
+    file_cache=None,
+    copy_on_write=False,
+    freeze=False,
+    executor=None,
+    lazy=False,
+    profile=None,
+    stream=False,
+    evaluation="ordered",
+    result_cache=None,
+    only=None,
 ):
     """
     Reads and process yaml config files
@@ -338,9 +937,66 @@ def read(
     :param extend_key_word  The name of section with list of included files
     :param ignore_errors  Do not rise exception when value can't be rendered
     :param ignore_not_existed_files Do not rise exception if the file not found
+    :param loader         yaml loader: "full", "safe", "full_python", "safe_python" or loader class
+    :param file_cache     FileCache instance to reuse parsed files between reads
+    :param copy_on_write  Share unchanged subtrees between inherit/cp copies and their source
+    :param freeze         Return read-only data (FrozenDict and tuples instead of dict and list)
+    :param executor       Thread or process pool executor to read and parse included files in parallel
+    :param lazy           Evaluate $() values on first access, the data is LazyDict
+    :param profile        metayaml.profile.Profile instance to record timings of loading
+    :param stream         Parse and merge files by top level keys without building the whole
+                          document, the extend key should be the first key of a file
+    :param evaluation     "ordered" - expressions are evaluated in order of the files and values,
+                          "topological" - after the values they refer to
+    :param result_cache   ResultCache instance to reuse the whole result of the same read() call,
+                          defaults are not modified then. Not used with lazy
+    :param only           Key path or key paths like "db" or "services.api" to keep in the result, other
+                          top level sections are merged only if expressions refer to them, so
+                          errors in other sections are not raised. The defaults dict is not
+                          changed in this mode
     """
+    if isinstance(only, str):
+        only = [only]
+    key = None
+    if result_cache is not None and not lazy:
+        # a generator of file names can be iterated only once
+        yaml_file = [yaml_file] if isinstance(yaml_file, str) else list(yaml_file)
+        key = (
+            tuple(os.path.abspath(f) for f in yaml_file),
+            fingerprint(defaults or {}),
+            extend_key_word,
+            ignore_errors,
+            ignore_not_existed_files,
+            _loader_class(loader),
+            copy_on_write,
+            freeze,
+            stream,
+            evaluation,
+            None if only is None else tuple(sorted(map(str, only))),
+        )
+        data = result_cache.lookup(key)
+        if data is not None:
+            return data if freeze else copy_tree(data)
+        defaults = copy_tree(defaults or {})
 
     m = MetaYaml(
-        yaml_file, defaults, extend_key_word, ignore_errors, ignore_not_existed_files
+        yaml_file,
+        defaults,
+        extend_key_word,
+        ignore_errors,
+        ignore_not_existed_files,
+        loader=loader,
+        file_cache=file_cache,
+        copy_on_write=copy_on_write,
+        freeze=freeze,
+        executor=executor,
+        lazy=lazy,
+        profile=profile,
+        stream=stream,
+        evaluation=evaluation,
+        only=only,
     )
+    if key is not None:
+        cached = m.data if freeze else copy_tree(m.data)
+        result_cache.store(key, cached, m.file_stamps, m.globs)
     return m.data
@@ -0,0 +1,128 @@
+"""
+Rendering of one config tree with many sets of defaults.
+
+RenderPlan keeps everything which doesn't depend on defaults: parsed documents of the
+files, results of file name patterns and compiled expressions. Every render merges and
+evaluates the documents with its defaults, so the result is the same as read() of the
+files with these defaults. Files included by names which depend on defaults are read
+when a render needs them first.
+"""
+
+import typing as tp
+from concurrent.futures import Executor
+
+from metayaml.batch import map_chunks
+from metayaml.bundle import DocumentLoader, file_list
+from metayaml.cache import copy_tree
+from metayaml.exception import MetaYamlException
+
+# arguments of MetaYaml which the plan replaces
+_NOT_USED = ("executor", "stream", "file_cache", "checkpoints")
+
+
+class RenderPlan(object):
+    """
+    Config files parsed once and rendered with different defaults.
+
+    The plan can be pickled with its documents and compiled expressions, so it is
+    sent to process pool workers as it is.
+
+    :param yaml_file      yaml file name or list of file names
+    :param kwargs         Other arguments of MetaYaml, the same for all renders
+    """
+
+    def __init__(self, yaml_file: tp.Union[str, tp.List[str]], **kwargs):
+        not_used = [name for name in _NOT_USED if name in kwargs]
+        if not_used:
+            raise MetaYamlException(
+                f"RenderPlan can't be used with {', '.join(not_used)}"
+            )
+        self.yaml_file = file_list(yaml_file)
+        self.kwargs = kwargs
+        self.documents: tp.Dict[str, tp.Tuple[tp.Tuple, tp.Any]] = {}
+        self.globs: tp.Dict[str, tp.List[str]] = {}
+        self.expressions: tp.Set[tp.Tuple[str, tp.Tuple[str, str]]] = set()
+        # marshaled code of the expressions, compiled when the plan is pickled
+        self._codes: tp.Dict[tp.Tuple[str, tp.Tuple[str, str]], tp.Optional[bytes]] = {}
+
+    def render(self, defaults: tp.Optional[dict] = None):
+        """
+        Returns the config data rendered with defaults
+        """
+        m = DocumentLoader(
+            self.yaml_file,
+            defaults,
+            documents=self.documents,
+            globs=self.globs,
+            expressions=self.expressions,
+            **self.kwargs,
+        )
+        return m.data
+
+    def render_many(
+        self,
+        defaults_list: tp.Iterable[tp.Optional[dict]],
+        executor: tp.Optional[Executor] = None,
+        chunks: tp.Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> tp.List:
+        """
+        Renders the config with every defaults, the result is in the same order as defaults_list
+
+        :param defaults_list  Dictionaries with default values, every render gets its own copy
+        :param executor       Thread or process pool executor to render in parallel. The first
+                              defaults are rendered here, so the files are parsed once
+                              before the plan is sent to workers
+        :param chunks         Number of chunks for executor, by default the number of CPUs
+        :param return_exceptions  Return exceptions in the result list instead of raising the first one
+        """
+        defaults_list = list(defaults_list)
+        if executor is None or len(defaults_list) < 2:
+            return _render_chunk(defaults_list, self, return_exceptions)
+
+        result = _render_chunk(defaults_list[:1], self, return_exceptions)
+        result.extend(
+            map_chunks(
+                executor,
+                _render_chunk,
+                defaults_list[1:],
+                chunks,
+                self,
+                return_exceptions,
+            )
+        )
+        return result
+
+    def __getstate__(self) -> dict:
+        from metayaml.jinja_eval import dump_templates
+
+        ignore_errors = self.kwargs.get("ignore_errors", False)
+        new = self.expressions - self._codes.keys()
+        for val, brackets, code in dump_templates(new, ignore_errors):
+            self._codes[val, brackets] = code
+        return self.__dict__
+
+    def __setstate__(self, state: dict):
+        from metayaml.jinja_eval import load_templates
+
+        self.__dict__.update(state)
+        load_templates(
+            [(val, brackets, code) for (val, brackets), code in self._codes.items()],
+            self.kwargs.get("ignore_errors", False),
+        )
+
+
+def _render_chunk(
+    defaults_list: tp.List[tp.Optional[dict]], plan: RenderPlan, return_exceptions: bool
+) -> tp.List:
+    result = []
+    for defaults in defaults_list:
+        try:
+            data = plan.render(copy_tree(defaults or {}))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            result.append(e)
+        else:
+            result.append(data)
+    return result
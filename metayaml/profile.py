@@ -0,0 +1,111 @@
+"""
+Profiling of config loading.
+
+Pass Profile instance to read()/MetaYaml to record how long file parsing, merging,
+expression compiling and rendering, inherit copying and the lazy pass take.
+"""
+
+import heapq
+import itertools
+import typing as tp
+from collections import namedtuple
+
+from metayaml.exception import MetaYamlExceptionPath
+
+ProfileEvent = namedtuple("ProfileEvent", ["kind", "name", "duration", "info"])
+
+# kinds of events
+PARSE = "parse"  # file reading and parsing, name is file path
+MERGE = "merge"  # merge of file into data with eager evaluation, name is file path
+COMPILE = "compile"  # template compiling, name is key path
+RENDER = "render"  # expression evaluation, name is key path
+INHERIT = "inherit"  # copy of inherited dict, name is key path
+LAZY = "lazy"  # evaluation of lazy values, name is empty
+
+_FILE_KINDS = (PARSE, MERGE)
+_PATH_KINDS = (COMPILE, RENDER, INHERIT)
+
+
+class Profile(object):
+    """
+    Collects timings of config loading
+
+    :param callback       Function called with every ProfileEvent, e.g. to export it to metrics
+    :param keep_events    Keep all events in the events list
+    :param keep_slowest   Number of the slowest events of every kind kept without keep_events
+    """
+
+    def __init__(
+        self,
+        callback: tp.Optional[tp.Callable[[ProfileEvent], None]] = None,
+        keep_events: bool = True,
+        keep_slowest: int = 10,
+    ):
+        self.callback = callback
+        self.keep_events = keep_events
+        self.keep_slowest = keep_slowest
+        self.events: tp.List[ProfileEvent] = []
+        # heaps of (duration, number, event) of the slowest events by kind
+        self._slowest: tp.Dict[str, tp.List[tp.Tuple[float, int, ProfileEvent]]] = {}
+        self._numbers = itertools.count()
+        self.totals: tp.Dict[str, float] = {}
+        self.counts: tp.Dict[str, int] = {}
+        self.template_hits = 0
+        self.template_misses = 0
+        self.file_cache_hits = 0
+        self.file_cache_misses = 0
+
+    def record(self, kind: str, name, duration: float, **info):
+        if isinstance(name, tuple):
+            name = MetaYamlExceptionPath._path_to_str(name)
+        event = ProfileEvent(kind, name, duration, info)
+        self.totals[kind] = self.totals.get(kind, 0.0) + duration
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if self.keep_events:
+            self.events.append(event)
+        elif self.keep_slowest > 0:
+            heap = self._slowest.setdefault(kind, [])
+            item = (duration, next(self._numbers), event)
+            if len(heap) < self.keep_slowest:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+        if self.callback is not None:
+            self.callback(event)
+
+    def slowest(
+        self, kinds: tp.Iterable[str], top: int = 10
+    ) -> tp.List[tp.Tuple[str, float]]:
+        """
+        Returns names with the biggest total duration of the events of given kinds.
+        Without keep_events only the slowest kept events are counted.
+        """
+        kinds = set(kinds)
+        if self.keep_events:
+            events: tp.Iterable[ProfileEvent] = self.events
+        else:
+            events = (item[2] for kind in kinds for item in self._slowest.get(kind, ()))
+        durations: tp.Dict[str, float] = {}
+        for event in events:
+            if event.kind in kinds:
+                durations[event.name] = durations.get(event.name, 0.0) + event.duration
+        return sorted(durations.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def report(self, top: int = 10) -> dict:
+        """
+        Returns profile as dict of plain types, suitable for json or metrics export
+        """
+        return {
+            "totals": dict(self.totals),
+            "counts": dict(self.counts),
+            "template_cache": {
+                "hits": self.template_hits,
+                "misses": self.template_misses,
+            },
+            "file_cache": {
+                "hits": self.file_cache_hits,
+                "misses": self.file_cache_misses,
+            },
+            "slowest_files": self.slowest(_FILE_KINDS, top),
+            "slowest_paths": self.slowest(_PATH_KINDS, top),
+        }
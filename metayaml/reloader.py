@@ -0,0 +1,107 @@
+import os
+import typing as tp
+from glob import glob
+
+from metayaml.cache import FileCache, copy_tree, file_stamp
+from metayaml.checkpoint import Checkpoints
+from metayaml.metayaml import MetaYaml
+
+Path = tp.Tuple
+
+
+def diff_paths(old, new, path: Path = ()) -> tp.List[Path]:
+    """
+    Returns paths of values which are different in old and new data
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed = []
+        for key, value in old.items():
+            if key not in new:
+                changed.append(path + (key,))
+            else:
+                changed.extend(diff_paths(value, new[key], path + (key,)))
+        changed.extend(path + (key,) for key in new if key not in old)
+        return changed
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changed = []
+        for index, (old_value, new_value) in enumerate(zip(old, new)):
+            changed.extend(diff_paths(old_value, new_value, path + (index,)))
+        return changed
+
+    if type(old) != type(new) or old != new:
+        return [path]
+    return []
+
+
+class Reloader(object):
+    """
+    Keeps config up to date with its files.
+
+    The parsed files are cached, so only changed files are parsed again, and the
+    merged data before the first changed file is restored from a checkpoint. All files
+    merged after it are merged and evaluated again, whether they depend on the change
+    or not, and all lazy values are evaluated again.
+
+    :param yaml_file      yaml file name or list of file names
+    :param defaults       Dictionary with default values which can be use during parsing yaml files
+    :param file_cache     FileCache instance, by default unbounded cache of the reloader
+    :param checkpoints    Checkpoints instance, by default checkpoints of the reloader
+    :param kwargs         Other arguments of MetaYaml
+    """
+
+    def __init__(
+        self,
+        yaml_file: tp.Union[str, tp.List[str]],
+        defaults: tp.Optional[dict] = None,
+        file_cache: tp.Optional[FileCache] = None,
+        checkpoints: tp.Optional[Checkpoints] = None,
+        **kwargs,
+    ):
+        self.yaml_file = yaml_file
+        self.defaults = defaults or {}
+        self.file_cache = file_cache if file_cache is not None else FileCache(None)
+        self.checkpoints = checkpoints if checkpoints is not None else Checkpoints()
+        self.kwargs = kwargs
+        self.data: tp.Optional[dict] = None
+        self.file_stamps: tp.Dict[str, tp.Tuple] = {}
+        self.globs: tp.Dict[str, tp.List[str]] = {}
+
+    def changed_files(self) -> tp.List[str]:
+        """
+        Returns files which were changed, removed or added to glob patterns since the last load
+        """
+        changed = []
+        for file_path, stamp in self.file_stamps.items():
+            try:
+                if file_stamp(file_path, stamp) != stamp:
+                    changed.append(file_path)
+            except OSError:
+                changed.append(file_path)
+
+        for pattern, found_files in self.globs.items():
+            for file_path in sorted(set(glob(pattern)) - set(found_files)):
+                changed.append(file_path)
+        return changed
+
+    def reload(self, force: bool = False) -> tp.Tuple[dict, tp.List[Path]]:
+        """
+        Loads config again if any of its files was changed
+
+        :return: new data and list of changed paths
+        """
+        if self.data is not None and not force and not self.changed_files():
+            return self.data, []
+
+        m = MetaYaml(
+            self.yaml_file,
+            copy_tree(self.defaults),
+            file_cache=self.file_cache,
+            checkpoints=self.checkpoints,
+            **self.kwargs,
+        )
+        changed = diff_paths(self.data, m.data) if self.data is not None else []
+        self.data = m.data
+        self.file_stamps = m.file_stamps
+        self.globs = m.globs
+        return self.data, changed
@@ -0,0 +1,342 @@
+"""
+Read-only config data in a memory mapped file.
+
+publish() serializes the loaded data to a binary file, SharedConfig maps it into memory
+and decodes only accessed values. All processes which map the file share its pages,
+Python objects are created on access only, so refcount changes don't copy the config
+into every worker of a pre-fork server.
+
+Every value is a one byte tag followed by its content, dicts and lists keep offsets of
+their items. A dict has entries (key offset, value offset) in the original order and a
+table of (crc32 of the encoded key, entry number) sorted by hash for lookups. Numbers
+which are equal (1, 1.0 and True) have the same hash, so they find the same key like
+in a dict.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import typing as tp
+import zlib
+from collections.abc import Mapping, Sequence
+
+from metayaml.cache import atomic_write
+from metayaml.exception import MetaYamlException
+from metayaml.index import parse_path
+
+SHARED_MAGIC = b"MYSHARED"
+SHARED_VERSION = 2
+
+_HEADER = struct.Struct("<8sBQ")  # magic, version, offset of the root value
+_COUNT = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_ENTRY = struct.Struct("<QQ")
+_SLOT = struct.Struct("<II")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+
+_NONE = b"N"
+_TRUE = b"T"
+_FALSE = b"F"
+_INT_TAG = b"I"
+_FLOAT_TAG = b"D"
+_STR = b"S"
+_BYTES = b"B"
+_PICKLE = b"P"
+_LIST = b"L"
+_DICT = b"M"
+
+
+def _encode_scalar(value) -> bytes:
+    if value is None:
+        return _NONE
+    if value is True:
+        return _TRUE
+    if value is False:
+        return _FALSE
+    if type(value) is int and -(2**63) <= value < 2**63:
+        return _INT_TAG + _INT.pack(value)
+    if type(value) is float:
+        return _FLOAT_TAG + _FLOAT.pack(value)
+    if type(value) is str:
+        content = value.encode("utf-8", "surrogatepass")
+        return _STR + _COUNT.pack(len(content)) + content
+    if type(value) is bytes:
+        return _BYTES + _COUNT.pack(len(value)) + value
+    content = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return _PICKLE + _COUNT.pack(len(content)) + content
+
+
+def _key_hash(key) -> int:
+    if type(key) is bool or (type(key) is float and key.is_integer()):
+        key = int(key)
+    return zlib.crc32(_encode_scalar(key))
+
+
+class _Writer(object):
+    def __init__(self):
+        self.buf = bytearray(_HEADER.size)
+        self.scalars: tp.Dict[bytes, int] = {}
+        # containers which were written, keys are ids, the sources are kept alive
+        self.containers: tp.Dict[int, tp.Tuple[tp.Any, int]] = {}
+
+    def _scalar(self, encoded: bytes) -> int:
+        offset = self.scalars.get(encoded)
+        if offset is None:
+            offset = self.scalars[encoded] = len(self.buf)
+            self.buf += encoded
+        return offset
+
+    def add(self, value) -> int:
+        if isinstance(value, Mapping):
+            return self._container(value, self._dict)
+        if isinstance(value, (list, tuple)) or (
+            isinstance(value, Sequence) and not isinstance(value, (str, bytes))
+        ):
+            return self._container(value, self._list)
+        return self._scalar(_encode_scalar(value))
+
+    def _container(self, value, write: tp.Callable) -> int:
+        written = self.containers.get(id(value))
+        if written is not None:
+            return written[1]
+        offset = write(value)
+        self.containers[id(value)] = (value, offset)
+        return offset
+
+    def _list(self, value) -> int:
+        offsets = [self.add(item) for item in value]
+        offset = len(self.buf)
+        self.buf += _LIST + _COUNT.pack(len(offsets))
+        self.buf += b"".join(_OFFSET.pack(o) for o in offsets)
+        return offset
+
+    def _dict(self, value: Mapping) -> int:
+        entries = []
+        slots = []
+        for i, (key, item) in enumerate(value.items()):
+            entries.append(
+                _ENTRY.pack(self._scalar(_encode_scalar(key)), self.add(item))
+            )
+            slots.append((_key_hash(key), i))
+        slots.sort()
+
+        offset = len(self.buf)
+        self.buf += _DICT + _COUNT.pack(len(entries)) + b"".join(entries)
+        self.buf += b"".join(_SLOT.pack(h, i) for h, i in slots)
+        return offset
+
+
+def dumps(data) -> bytes:
+    """
+    Returns data in the shared format
+    """
+    writer = _Writer()
+    root = writer.add(data)
+    _HEADER.pack_into(writer.buf, 0, SHARED_MAGIC, SHARED_VERSION, root)
+    return bytes(writer.buf)
+
+
+def publish(data, path: str):
+    """
+    Writes data to the shared file, the file is replaced atomically, so readers see either
+    the old or the new version
+    """
+    atomic_write(os.path.abspath(path), dumps(data))
+
+
+def _decode(buf, offset: int):
+    tag = buf[offset : offset + 1]
+    if tag == _DICT:
+        return SharedDict(buf, offset)
+    if tag == _LIST:
+        return SharedList(buf, offset)
+    if tag == _STR:
+        (size,) = _COUNT.unpack_from(buf, offset + 1)
+        start = offset + 1 + _COUNT.size
+        return str(buf[start : start + size], "utf-8", "surrogatepass")
+    if tag == _INT_TAG:
+        return _INT.unpack_from(buf, offset + 1)[0]
+    if tag == _FLOAT_TAG:
+        return _FLOAT.unpack_from(buf, offset + 1)[0]
+    if tag == _NONE:
+        return None
+    if tag == _TRUE:
+        return True
+    if tag == _FALSE:
+        return False
+    (size,) = _COUNT.unpack_from(buf, offset + 1)
+    start = offset + 1 + _COUNT.size
+    if tag == _BYTES:
+        return bytes(buf[start : start + size])
+    return pickle.loads(buf[start : start + size])
+
+
+class SharedDict(Mapping):
+    """
+    Read-only dict view of the shared file, values are decoded on access
+    """
+
+    __slots__ = ("_buf", "_entries", "_count")
+
+    def __init__(self, buf, offset: int):
+        self._buf = buf
+        (self._count,) = _COUNT.unpack_from(buf, offset + 1)
+        self._entries = offset + 1 + _COUNT.size
+
+    def _find(self, key) -> int:
+        encoded = _encode_scalar(key)
+        number = type(key) in (int, float, bool)
+        h = _key_hash(key)
+        slots = self._entries + self._count * _ENTRY.size
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _SLOT.unpack_from(self._buf, slots + mid * _SLOT.size)[0] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        while lo < self._count:
+            slot_hash, i = _SLOT.unpack_from(self._buf, slots + lo * _SLOT.size)
+            if slot_hash != h:
+                break
+            key_offset, value_offset = _ENTRY.unpack_from(
+                self._buf, self._entries + i * _ENTRY.size
+            )
+            if number:
+                if _decode(self._buf, key_offset) == key:
+                    return value_offset
+            elif self._buf[key_offset : key_offset + len(encoded)] == encoded:
+                return value_offset
+            lo += 1
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return _decode(self._buf, self._find(key))
+
+    def __contains__(self, key) -> bool:
+        try:
+            self._find(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for i in range(self._count):
+            key_offset, _ = _ENTRY.unpack_from(
+                self._buf, self._entries + i * _ENTRY.size
+            )
+            yield _decode(self._buf, key_offset)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return f"SharedDict({self.materialize()!r})"
+
+    def materialize(self) -> dict:
+        """
+        Returns the data as plain dicts and lists
+        """
+        return {key: materialize(value) for key, value in self.items()}
+
+
+class SharedList(Sequence):
+    """
+    Read-only list view of the shared file, items are decoded on access
+    """
+
+    __slots__ = ("_buf", "_items", "_count")
+
+    def __init__(self, buf, offset: int):
+        self._buf = buf
+        (self._count,) = _COUNT.unpack_from(buf, offset + 1)
+        self._items = offset + 1 + _COUNT.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("list index out of range")
+        (offset,) = _OFFSET.unpack_from(self._buf, self._items + index * _OFFSET.size)
+        return _decode(self._buf, offset)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"SharedList({self.materialize()!r})"
+
+    def materialize(self) -> list:
+        """
+        Returns the data as plain lists and dicts
+        """
+        return [materialize(value) for value in self]
+
+
+def materialize(value):
+    """
+    Decodes all values of shared views and returns plain dicts and lists
+    """
+    if isinstance(value, (SharedDict, SharedList)):
+        return value.materialize()
+    return value
+
+
+class SharedConfig(object):
+    """
+    Config published by publish(), mapped into memory.
+
+    :param path     The name of the shared file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: tp.Any = None
+        self.stamp: tp.Optional[tp.Tuple] = None
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, root = _HEADER.unpack_from(buf, 0)
+        if magic != SHARED_MAGIC or version != SHARED_VERSION:
+            raise MetaYamlException(
+                f"{self.path} is not a shared config of this version"
+            )
+        # views of the previous version keep its mapping alive
+        self.data = _decode(buf, root)
+        self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def refresh(self) -> bool:
+        """
+        Maps the new version of the file if it was published, returns True if the data is changed
+        """
+        st = os.stat(self.path)
+        if (st.st_ino, st.st_mtime_ns, st.st_size) == self.stamp:
+            return False
+        self._open()
+        return True
+
+    def get(self, path: tp.Union[str, tp.Iterable], default=None):
+        """
+        Returns the value by key path, e.g. "db.hosts[0]" or ("db", "hosts", 0)
+        """
+        if isinstance(path, str):
+            path = parse_path(path)
+        value = self.data
+        try:
+            for key in path:
+                value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+        return value
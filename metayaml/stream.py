@@ -0,0 +1,68 @@
+"""
+Reading of yaml files by top level entries.
+
+The document is composed and constructed one top level key at a time, so the whole
+document tree is never kept in memory: every entry is merged into the data and
+dropped before the next one is parsed.
+"""
+
+import os
+import typing as tp
+from functools import lru_cache
+
+
+def stream_document(file_path: str, loader: type) -> tp.Tuple[tp.Tuple, tp.Iterator]:
+    """
+    Returns file stamp (mtime_ns, size) and iterator over (key, value) of the top level
+    mapping of the yaml file
+    """
+    f = open(file_path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+    except BaseException:
+        f.close()
+        raise
+    return (st.st_mtime_ns, st.st_size), _entries(f, loader)
+
+
+@lru_cache(maxsize=None)
+def _composing_loader(loader: type) -> type:
+    from yaml.composer import Composer
+
+    if issubclass(loader, Composer):
+        return loader
+    # libyaml based loaders compose nodes in C, python composer builds them from events
+    return type(loader.__name__, (loader, Composer), {})
+
+
+def _entries(f, loader: type) -> tp.Iterator[tp.Tuple[tp.Any, tp.Any]]:
+    from yaml.events import MappingEndEvent, MappingStartEvent, StreamEndEvent
+
+    with f:
+        parser = _composing_loader(loader)(f)
+        parser.anchors = {}
+        try:
+            parser.get_event()  # stream start
+            if parser.check_event(StreamEndEvent):
+                return
+            parser.get_event()  # document start
+
+            if not parser.check_event(MappingStartEvent):
+                node = parser.compose_node(None, None)
+                value = parser.construct_object(node, deep=True)
+                assert value is None, "yaml document should be a mapping"
+                return
+
+            parser.get_event()
+            while not parser.check_event(MappingEndEvent):
+                key_node = parser.compose_node(None, None)
+                value_node = parser.compose_node(None, key_node)
+                key = parser.construct_object(key_node, deep=True)
+                value = parser.construct_object(value_node, deep=True)
+                # constructed objects of the entry are not needed anymore,
+                # anchors are kept for aliases in the next entries
+                parser.constructed_objects = {}
+                parser.recursive_objects = {}
+                yield key, value
+        finally:
+            parser.dispose()
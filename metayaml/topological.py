@@ -0,0 +1,332 @@
+"""
+Evaluation of expressions in the order of their dependencies.
+
+In this mode eager values are not rendered when they are merged: the merge puts a
+Deferred placeholder in the data. The key paths which an expression refers to are
+taken from its jinja AST, they lead to the placeholders it depends on, and every
+placeholder is evaluated once, after all placeholders it depends on (depth first,
+without recursion). A placeholder which is met again while its dependencies are being
+evaluated is a reference cycle. An expression which refers to its own key sees the
+value which the key had before, as in the ordered mode.
+
+Placeholders are evaluated when the merge needs their values (a dict is merged into
+one or another expression refers to it) and after the merge in two walks over the
+data: the first one evaluates eager values, the second one lazy values instead of
+process_lazy, so eager values see lazy ones not rendered yet.
+"""
+
+import typing as tp
+from functools import lru_cache
+from types import ModuleType
+
+from metayaml.exception import MetaYamlExceptionPath
+
+Path = tp.Tuple
+
+_PENDING = 0
+_ACTIVE = 1
+_DONE = 2
+
+# previous value of a key which hadn't been in the data
+MISSING = object()
+
+
+class Deferred(object):
+    """
+    Placeholder of an expression in the data
+    """
+
+    __slots__ = ("val", "path", "eager", "state", "value", "previous")
+
+    def __init__(self, val: str, path: Path, eager: bool, previous=MISSING):
+        self.val = val
+        self.path = path
+        self.eager = eager
+        self.state = _PENDING
+        self.value = None
+        self.previous = previous
+
+    def __deepcopy__(self, memo):
+        # copies of the data refer to the same expression, it is evaluated once
+        return self
+
+    def __repr__(self) -> str:
+        return f"Deferred({self.val!r})"
+
+
+class Resolver(object):
+    """
+    Finds and evaluates placeholders which expressions depend on
+    """
+
+    __slots__ = ("loader", "final", "_clean", "_lazy_done", "_evaluating")
+
+    def __init__(self, loader):
+        self.loader = loader
+        # after the merge lazy values are evaluated as well
+        self.final = False
+        # containers without placeholders in their subtrees, by id
+        self._clean: tp.Dict[int, tp.Any] = {}
+        # (container id, key) of evaluated lazy values, they aren't rendered again
+        self._lazy_done: tp.Set[tp.Tuple[int, tp.Any]] = set()
+        self._evaluating = False
+
+    def changed(self):
+        """
+        Should be called when the merge puts a placeholder in the data
+        """
+        if self._clean:
+            self._clean.clear()
+
+    def _placeholder(self, container, key, value, path: Path) -> tp.Optional[Deferred]:
+        """
+        Returns the placeholder of the value, evaluated placeholder is replaced by its value
+        """
+        if isinstance(value, Deferred):
+            if value.state != _DONE:
+                return value
+            container[key] = value.value
+            if not value.eager:
+                self._lazy_done.add((id(container), key))
+            return None
+        if (
+            self.final
+            and isinstance(value, str)
+            and self.loader.lazy_brackets[0] in value
+            and (id(container), key) not in self._lazy_done
+        ):
+            deferred = Deferred(value, path, False, value)
+            container[key] = deferred
+            return deferred
+        return None
+
+    def _pending_under(
+        self,
+        value,
+        path: Path,
+        current: tp.Optional[Deferred],
+        found: tp.List[Deferred],
+        own: tp.List[tp.Tuple[tp.Any, tp.Any]],
+    ):
+        """
+        Adds placeholders of the subtree to found and places of current to own
+        """
+        stack = [(value, path)]
+        seen: tp.Dict[int, tp.Any] = {}
+        count = len(found) + len(own)
+        while stack:
+            container, container_path = stack.pop()
+            if id(container) in seen or id(container) in self._clean:
+                continue
+            seen[id(container)] = container
+            items = (
+                container.items()
+                if isinstance(container, dict)
+                else enumerate(container)
+            )
+            for key, item in list(items):
+                if item is current:
+                    own.append((container, key))
+                    continue
+                item_path = _child(container_path, key)
+                pending = self._placeholder(container, key, item, item_path)
+                if pending is not None:
+                    found.append(pending)
+                    continue
+                item = container[key]
+                if isinstance(item, (dict, list)):
+                    stack.append((item, item_path))
+        if len(found) + len(own) == count:
+            self._clean.update(seen)
+
+    def pending(
+        self,
+        val: str,
+        brackets: tp.Tuple[str, str],
+        global_data,
+        current: tp.Optional[Deferred] = None,
+    ) -> tp.Tuple[tp.List[Deferred], tp.List[tp.Tuple[tp.Any, tp.Any]]]:
+        """
+        Returns not evaluated placeholders which the expression refers to and the
+        places of the current placeholder among the references
+        """
+        template_references = _jinja_eval().template_references
+        found: tp.List[Deferred] = []
+        own: tp.List[tp.Tuple[tp.Any, tp.Any]] = []
+        for reference in template_references(val, brackets):
+            container = global_data
+            path: Path = ("#",)
+            for step in reference:
+                if isinstance(container, dict):
+                    if step not in container:
+                        break
+                elif not (
+                    isinstance(container, list)
+                    and isinstance(step, int)
+                    and -len(container) <= step < len(container)
+                ):
+                    break
+                path = _child(path, step)
+                item = container[step]
+                if current is not None and item is current:
+                    own.append((container, step))
+                    container = None
+                    break
+                pending = self._placeholder(container, step, item, path)
+                if pending is not None:
+                    found.append(pending)
+                    container = None
+                    break
+                container = container[step]
+            if isinstance(container, (dict, list)) and container is not global_data:
+                self._pending_under(container, path, current, found, own)
+        return found, own
+
+    def prepare(self, val: str, brackets: tp.Tuple[str, str], global_data):
+        """
+        Evaluates all placeholders which the expression refers to
+        """
+        if self._evaluating:
+            # the placeholder being evaluated has its dependencies evaluated already
+            return
+        while True:
+            found, _ = self.pending(val, brackets, global_data)
+            if not found:
+                return
+            for deferred in found:
+                self.resolve(deferred, global_data)
+
+    def evaluated(self, value, global_data, path: Path):
+        """
+        Returns the value with all placeholders in it evaluated
+        """
+        if isinstance(value, Deferred):
+            return self.resolve(value, global_data)
+        if isinstance(value, (dict, list)):
+            while True:
+                found: tp.List[Deferred] = []
+                self._pending_under(value, path, None, found, [])
+                if not found:
+                    break
+                for deferred in found:
+                    self.resolve(deferred, global_data)
+        return value
+
+    def resolve(self, target: Deferred, global_data):
+        """
+        Evaluates the placeholder after all placeholders it depends on
+        """
+        stack = [target]
+        while stack:
+            deferred = stack[-1]
+            if deferred.state == _DONE:
+                stack.pop()
+                continue
+
+            deferred.state = _ACTIVE
+            brackets = self._brackets(deferred)
+            found, own = self.pending(deferred.val, brackets, global_data, deferred)
+            if own:
+                if deferred.previous is MISSING:
+                    found.append(deferred)
+                elif isinstance(deferred.previous, Deferred):
+                    if deferred.previous.state != _DONE:
+                        found.append(deferred.previous)
+            if not found:
+                deferred.value = self._evaluate(deferred, global_data, own)
+                deferred.state = _DONE
+                stack.pop()
+                continue
+
+            for dependency in found:
+                if dependency.state == _ACTIVE:
+                    start = len(stack) - 1 - stack[::-1].index(dependency)
+                    cycle = [d for d in stack[start:] if d.state == _ACTIVE] + [
+                        dependency
+                    ]
+                    paths = " -> ".join(
+                        MetaYamlExceptionPath._path_to_str(d.path) for d in cycle
+                    )
+                    raise MetaYamlExceptionPath(
+                        f"Cyclic reference {paths}", deferred.path, deferred.val
+                    )
+            stack.extend(reversed(found))
+        return target.value
+
+    def _brackets(self, deferred: Deferred) -> tp.Tuple[str, str]:
+        return (
+            self.loader.eager_brackets if deferred.eager else self.loader.lazy_brackets
+        )
+
+    def _evaluate(self, deferred: Deferred, global_data, own):
+        previous = deferred.previous
+        if isinstance(previous, Deferred):
+            previous = previous.value
+        for container, key in own:
+            container[key] = previous
+        self._evaluating = True
+        try:
+            return self.loader.eval_value(
+                deferred.val, deferred.path, global_data, deferred.eager
+            )
+        finally:
+            self._evaluating = False
+            for container, key in own:
+                container[key] = deferred
+
+    def finish(self, data: dict, path: Path):
+        """
+        Evaluates all placeholders and lazy values of the data
+        """
+        self._walk(data, path)
+        self.final = True
+        self._clean.clear()
+        self._walk(data, path)
+
+    def _walk(self, data: dict, path: Path):
+        stack = [(data, path)]
+        seen = set()
+        while stack:
+            container, container_path = stack.pop()
+            if id(container) in seen:
+                continue
+            seen.add(id(container))
+
+            if self.final and isinstance(container, dict):
+                for key in list(container):
+                    new_key = self.loader.eval_value(
+                        key, _child(container_path, key), data, False
+                    )
+                    if new_key != key:
+                        container[new_key] = container.pop(key)
+                keys = list(container)
+            else:
+                keys = (
+                    list(container)
+                    if isinstance(container, dict)
+                    else range(len(container))
+                )
+
+            for key in keys:
+                item_path = _child(container_path, key)
+                pending = self._placeholder(container, key, container[key], item_path)
+                if pending is not None:
+                    self.resolve(pending, data)
+                    self._placeholder(container, key, container[key], item_path)
+                value = container[key]
+                if isinstance(value, (dict, list)):
+                    stack.append((value, item_path))
+
+
+@lru_cache(maxsize=None)
+def _jinja_eval() -> ModuleType:
+    """
+    Returns the jinja_eval module, it is imported on first use
+    """
+    from metayaml import jinja_eval
+
+    return jinja_eval
+
+
+def _child(path: Path, key) -> Path:
+    return path + ((key,) if isinstance(key, int) else (str(key),))
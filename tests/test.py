@@ -1,10 +1,64 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import importlib.util
 import os
-from unittest import main, TestCase
-from metayaml import read, MetaYamlException
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import deepcopy
+from unittest import TestCase, main
 
+from metayaml import (
+    FileCache,
+    LRUCache,
+    MetaYaml,
+    MetaYamlException,
+    PathIndex,
+    ResultCache,
+    read,
+    template_cache,
+)
+from metayaml.aio import read_async, read_many
+from metayaml.batch import read_batch
+from metayaml.bundle import (
+    BUNDLE_MAGIC,
+    StaleBundle,
+    build_bundle,
+    load_bundle,
+    read_bundle,
+)
+from metayaml.checkpoint import Checkpoints
+from metayaml.frozen import FrozenDict
+from metayaml.jinja_eval import RenderContext
+from metayaml.plan import RenderPlan
+from metayaml.profile import Profile
+from metayaml.reloader import Reloader
+from metayaml.shared import SharedConfig, SharedDict, publish
 
-class TestMetaYaml(TestCase):
+
+class TempFilesMixin(object):
+    """
+    Temporary directory of a test with config files written by write()
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, filename, content) -> str:
+        path = os.path.join(self.tmp, filename)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+
+class TestMetaYaml(TempFilesMixin, TestCase):
 
     @staticmethod
     def _file_name(filename):
@@ -136,5 +190,952 @@ class TestMetaYaml(TestCase):
         }
         self.assertEqual(d, expected)
 
+    def test_render_context(self):
+        d = read(self._file_name("globals.yaml"), {"range": lambda n: "overridden"})
+        self.assertEqual(d["items"], ["o", "v", "e", "r", "r", "i", "d", "d", "e", "n"])
+        d = read(self._file_name("globals.yaml"))
+        self.assertEqual(d, {"items": [0, 1, 2], "count": 3})
+
+        context = RenderContext({1: "one", "a": "b"}, {"range": range})
+        self.assertEqual(sorted(context), ["1", "a", "range"])
+        self.assertEqual({key: context[key] for key in context}["1"], "one")
+        self.assertIn("1", context)
+        self.assertEqual(len(context), 3)
+
+    def test_loaders(self):
+        expected = read(
+            self._file_name("test.yaml"),
+            {"CWD": "", "join": os.path.join},
+            loader="full_python",
+        )
+        for loader in ["full", "safe", "safe_python"]:
+            d = read(
+                self._file_name("test.yaml"),
+                {"CWD": "", "join": os.path.join},
+                loader=loader,
+            )
+            self.assertEqual(d, expected)
+            self.assertEqual(list(d), list(expected))
+
+            d = read(self._file_name("test_order.yaml"), loader=loader)
+            self.assertEqual(
+                list(d["schedule"].keys()),
+                [60 * 60, 60 * 60 * 24, 60 * 60 * 24 * 30, 60 * 60 * 24 * 365],
+            )
+
+            d = read(self._file_name("dates.yaml"), loader=loader)
+            self.assertEqual(
+                d, {"released": "2012-04-20", "released_str": "2012-04-20"}
+            )
+
+        with self.assertRaises(MetaYamlException):
+            read(self._file_name("test.yaml"), loader="unknown")
+
+    def test_copy_on_write(self):
+        for filename in [
+            "test.yaml",
+            "cp.yaml",
+            "dict_update.yaml",
+            "inherit.yaml",
+            "inherit_deepcp.yaml",
+            "inherit_subst.yaml",
+            "list_eval.yaml",
+        ]:
+            expected = read(
+                self._file_name(filename), {"CWD": "", "join": os.path.join}
+            )
+            d = read(
+                self._file_name(filename),
+                {"CWD": "", "join": os.path.join},
+                copy_on_write=True,
+            )
+            self.assertEqual(d, expected)
+
+        d = read(self._file_name("inherit.yaml"), copy_on_write=True)
+        self.assertIs(d["baz"]["foobar"], d["foo"]["foobar"])
+        self.assertIsNot(d["baz"]["bar"], d["foo"]["bar"])
+
+        d = read(self._file_name("cp.yaml"), copy_on_write=True)
+        self.assertIsNot(d["schedule"]["nighttask"], d["cron"]["daily"])
+        self.assertEqual(d["cron"]["daily"], {"min": 0, "hour": 0})
+
+    def test_freeze(self):
+        d = read(self._file_name("inherit.yaml"), copy_on_write=True, freeze=True)
+        self.assertIsInstance(d, FrozenDict)
+        self.assertEqual(
+            d["baz"], {"foobar": (4, 5), "bar": {"baz": 44, "buz": 55, "foobar": 3}}
+        )
+        self.assertIs(d["baz"]["foobar"], d["foo"]["foobar"])
+        self.assertEqual(hash(d["bar"]), hash(FrozenDict(baz=1, buz=33, foobar=3)))
+        with self.assertRaises(TypeError):
+            d["bar"]["baz"] = 2
+
+    def test_frozen_compact(self):
+        d = read(self._file_name("list_eval.yaml"), {"join": os.path.join}, freeze=True)
+        self.assertEqual(d["data"][1], {"a": "1bar1"})
+        self.assertIsInstance(d["data"], tuple)
+        self.assertIs(FrozenDict(a=1, b=2)._keys, FrozenDict(a=3, b=4)._keys)
+        self.assertEqual(FrozenDict(a=1, b=2), {"a": 1, "b": 2})
+        self.assertNotEqual(FrozenDict(a=1, b=2), FrozenDict(a=1, b=3))
+        self.assertEqual(FrozenDict(a=1).get("b", 2), 2)
+        first, second = FrozenDict({1: "a"}), FrozenDict({True: "b"})
+        self.assertIs(type(next(iter(first))), int)
+        self.assertIs(type(next(iter(second))), bool)
+
+        frozen = read(self._file_name("inherit.yaml"), freeze=True)
+        self.assertIs(deepcopy(frozen), frozen)
+        loaded = pickle.loads(pickle.dumps(frozen))
+        self.assertEqual(loaded, frozen)
+        self.assertEqual(hash(loaded), hash(frozen))
+        self.assertIs(loaded["foo"]._keys, frozen["foo"]._keys)
+
+    def test_executor(self):
+        files = [
+            self._file_name("test.yaml"),
+            self._file_name("test_m*.yaml"),
+            self._file_name("dict_update.yaml"),
+        ]
+        expected = read(files, {"join": os.path.join})
+        cache = FileCache()
+        for executor in [ThreadPoolExecutor(4), ProcessPoolExecutor(2)]:
+            with executor:
+                for file_cache in [None, cache, cache]:
+                    d = read(
+                        files,
+                        {"join": os.path.join},
+                        file_cache=file_cache,
+                        executor=executor,
+                    )
+                    self.assertEqual(d, expected)
+                    self.assertEqual(list(d), list(expected))
+        self.assertEqual(cache.cache_info().misses, 6)
+
+    def test_stream(self):
+        defaults = {"CWD": os.getcwd(), "join": os.path.join}
+        for filename in [
+            "test.yaml",
+            "cp.yaml",
+            "dict_update.yaml",
+            "inherit.yaml",
+            "list_eval.yaml",
+            "test_order.yaml",
+            "dates.yaml",
+            "stream_inherit.yaml",
+            "stream_del_all.yaml",
+        ]:
+            for loader in ["full", "safe_python"]:
+                expected = read(
+                    self._file_name(filename), dict(defaults), loader=loader
+                )
+                d = read(
+                    self._file_name(filename),
+                    dict(defaults),
+                    loader=loader,
+                    stream=True,
+                )
+                self.assertEqual(d, expected)
+                self.assertEqual(list(d), list(expected))
+
+        late = self.write("late.yaml", "a: 1\nextend: [other.yaml]\n")
+        with self.assertRaises(MetaYamlException):
+            read(late, stream=True)
+        late_marker = self.write("late_marker.yaml", "a: 1\n${__del_all__}: true\n")
+        self.assertEqual(read(late_marker), {"a": 1})
+        with self.assertRaises(MetaYamlException):
+            read(late_marker, stream=True)
+        with self.assertRaises(MetaYamlException):
+            read(
+                self._file_name("test.yaml"),
+                defaults,
+                stream=True,
+                file_cache=FileCache(),
+            )
+
+        # a document keeps the last value of a duplicated key, stream mode can't
+        dup = self.write("dup.yaml", "a:\n  x: 1\nb: ${a}\na:\n  y: 2\n")
+        self.assertEqual(read(dup)["a"], {"y": 2})
+        for evaluation in ["ordered", "topological"]:
+            with self.assertRaisesRegex(MetaYamlException, "duplicated key"):
+                read(
+                    dup,
+                    stream=True,
+                    evaluation=evaluation,
+                    ignore_errors=True,
+                )
+
+    def test_stream_chain(self):
+        try:
+            import resource
+        except ImportError:
+            self.skipTest("resource module is not available")
+        for i in range(100):
+            extend = f"extend: [l{i - 1}.yaml]\n" if i else ""
+            root = self.write(f"l{i}.yaml", f"{extend}v{i}: {i}\n")
+        expected = read(root)
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(soft, 64), hard))
+        try:
+            profile = Profile()
+            started = time.perf_counter()
+            d = read(root, stream=True, profile=profile)
+            duration = time.perf_counter() - started
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        self.assertEqual(d, expected)
+        # every file records only its own merge time
+        self.assertLessEqual(profile.totals["merge"], duration)
+
+    def test_topological(self):
+        defaults = {"CWD": os.getcwd(), "join": os.path.join}
+        for filename in [
+            "test.yaml",
+            "cp.yaml",
+            "dict_update.yaml",
+            "inherit.yaml",
+            "inherit_subst.yaml",
+            "list_eval.yaml",
+            "test_order.yaml",
+            "test_multi.yaml",
+            "globals.yaml",
+        ]:
+            expected = read(self._file_name(filename), dict(defaults))
+            d = read(
+                self._file_name(filename), dict(defaults), evaluation="topological"
+            )
+            self.assertEqual(d, expected)
+
+        tmp = self.tmp
+        self.write("base.yaml", "base: ${A}\nc:\n  w: 1\n")
+        root = self.write(
+            "root.yaml",
+            "extend: ['${dir}/base.yaml']\n"
+            "B: ${A + 1}\nAA: ${B}\nA: 1\nlazy: $(AA * 10)\nmix: ${A} and $(B)\n"
+            "c: ${cp(d, y=B)}\nd:\n  x: ${A}\ne:\n  ${__inherit__}: d\n  z: ${AA}\n",
+        )
+        d = read(root, {"dir": tmp}, evaluation="topological")
+        self.assertEqual(
+            d,
+            {
+                "dir": tmp,
+                "base": 1,
+                "B": 2,
+                "AA": 2,
+                "A": 1,
+                "lazy": 20,
+                "mix": "1 and 2",
+                "c": {"x": 1, "y": 2},
+                "d": {"x": 1},
+                "e": {"x": 1, "z": 2},
+            },
+        )
+
+        cycle = self.write(
+            "cycle.yaml", "a: ${b}\nb: ${c}\nc: ${a}\nx: $(y)\ny: $(x)\n"
+        )
+        with self.assertRaisesRegex(MetaYamlException, "Cyclic reference"):
+            read(cycle, evaluation="topological")
+        self.write("cycle.yaml", "x: $(y)\ny: $(x)\n")
+        with self.assertRaisesRegex(MetaYamlException, "Cyclic reference"):
+            read(cycle, evaluation="topological")
+
+        # the value of a key refers to its value from the previous file
+        own = self.write(
+            "own.yaml", "extend: ['${dir}/base.yaml']\nbase: ${base + 1}\nc: ${c.w}\n"
+        )
+        for evaluation in ["ordered", "topological"]:
+            d = read(
+                own,
+                {"dir": tmp, "A": 1},
+                evaluation=evaluation,
+            )
+            self.assertEqual((d["base"], d["c"]), (2, 1))
+        with self.assertRaises(MetaYamlException):
+            read(root, evaluation="topological", lazy=True)
+
+    def test_deferred_imports(self):
+        code = (
+            "import sys, metayaml; assert 'yaml' not in sys.modules; "
+            "metayaml.read(sys.argv[1]); print('jinja2' in sys.modules)"
+        )
+        root = os.path.join(os.path.dirname(__file__), "..")
+        for filename, jinja_loaded in [("f3.yaml", "False"), ("cp.yaml", "True")]:
+            out = subprocess.run(
+                [sys.executable, "-c", code, self._file_name(filename)],
+                cwd=root,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(out.stdout.strip(), jinja_loaded)
+
+    def test_lazy(self):
+        for filename in [
+            "test.yaml",
+            "cp.yaml",
+            "list_eval.yaml",
+            "test_order.yaml",
+            "dict_update.yaml",
+            "inherit.yaml",
+        ]:
+            expected = read(
+                self._file_name(filename), {"CWD": "", "join": os.path.join}
+            )
+            d = read(
+                self._file_name(filename), {"CWD": "", "join": os.path.join}, lazy=True
+            )
+            self.assertEqual(d, expected)
+            self.assertEqual(list(d), list(expected))
+            self.assertEqual(d.materialize(), expected)
+            self.assertIs(type(d.materialize()), dict)
+
+        d = read(self._file_name("undef.yaml"), lazy=True)
+        self.assertEqual(d["foo"], "test")
+        with self.assertRaises(MetaYamlException):
+            d["bar"]
+
+        d = read(self._file_name("cp.yaml"), lazy=True, freeze=True)
+        self.assertIsInstance(d, FrozenDict)
+
+
+class TestFastEval(TestCase):
+
+    def test_same_as_jinja(self):
+        from metayaml.jinja_eval import jinja_eval_value
+
+        data = {
+            "hour": 3600,
+            "num": "12",
+            "loggers": {"metayaml": {"level": "debug", "vals": [1, 2]}, "0": "zero"},
+            "lst": [{"a": 1}, "b"],
+            "obj": os.path,
+        }
+        expressions = [
+            "${hour}",
+            "${num}",
+            "${loggers.metayaml.level}",
+            "${loggers.metayaml}",
+            "${loggers.metayaml.vals}",
+            "${loggers.metayaml.items}",
+            "${loggers['metayaml'].vals[1]}",
+            "${lst[0].a}",
+            "${lst.1}",
+            "${lst[-1]}",
+            "${obj.sep}",
+            "${60*60}",
+            "${10*60*1.5}",
+            "${(2+3)*4}",
+            "$(hour)",
+            "${hour} sec",
+            "${ hour }",
+            "${range}",
+        ]
+        failed = [
+            "${missing}",
+            "${lst[5]}",
+            "${loggers.unknown}",
+            "${hour.x}",
+            "${1/0}",
+        ]
+        for ignore_errors in [False, True]:
+            m = MetaYaml([], ignore_errors=ignore_errors)
+            for val in expressions + (failed if ignore_errors else []):
+                for _ in range(2):
+                    eager = val.startswith("${")
+                    brackets = m.eager_brackets if eager else m.lazy_brackets
+                    expected = jinja_eval_value(m, val, ("key",), data, eager, brackets)
+                    self.assertEqual(
+                        m.eval_value(val, ("key",), data, eager), expected, val
+                    )
+
+        m = MetaYaml([])
+        for val in failed:
+            with self.assertRaises(MetaYamlException) as e:
+                jinja_eval_value(m, val, ("key",), data, True, m.eager_brackets)
+            with self.assertRaises(MetaYamlException) as fast_e:
+                m.eval_value(val, ("key",), data, True)
+            self.assertEqual(str(fast_e.exception), str(e.exception))
+
+
+class TestTemplateCache(TestCase):
+
+    def setUp(self):
+        template_cache.cache_clear()
+
+    def test_shared_between_reads(self):
+        read(TestMetaYaml._file_name("cp.yaml"))
+        info = template_cache.cache_info()
+        self.assertEqual(info.hits, 0)
+        self.assertGreater(info.misses, 0)
+
+        read(TestMetaYaml._file_name("cp.yaml"))
+        second = template_cache.cache_info()
+        self.assertEqual(second.misses, info.misses)
+        self.assertEqual(second.hits, info.misses)
+        self.assertEqual(second.currsize, info.currsize)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.cache_info(), (1, 1, 1, 2, 2))
+
+
+class TestFileCache(TempFilesMixin, TestCase):
+
+    def test_cached_documents_are_not_modified(self):
+        cache = FileCache()
+        for filename in ["dict_update.yaml", "inherit.yaml", "list_eval.yaml"]:
+            expected = read(TestMetaYaml._file_name(filename), {"join": os.path.join})
+            for _ in range(2):
+                d = read(
+                    TestMetaYaml._file_name(filename),
+                    {"join": os.path.join},
+                    file_cache=cache,
+                )
+                self.assertEqual(d, expected)
+        info = cache.cache_info()
+        self.assertEqual(info.misses, 5)
+        self.assertEqual(info.hits, 5)
+
+    def test_invalidation(self):
+        for check_hash in [False, True]:
+            cache = FileCache(maxsize=1, check_hash=check_hash)
+            path = self.write("config.yaml", "foo: 1")
+            self.assertEqual(read(path, file_cache=cache), {"foo": 1})
+            self.assertEqual(read(path, file_cache=cache), {"foo": 1})
+            self.write("config.yaml", "foo: 22")
+            self.assertEqual(read(path, file_cache=cache), {"foo": 22})
+            self.assertEqual(cache.cache_info(), (1, 2, 0, 1, 1))
+
+
+class TestResultCache(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.mkdir(os.path.join(self.tmp, "conf.d"))
+        self.write("conf.d/a.yaml", "a: 1\n")
+        self.write("root.yaml", "extend: [conf.d/*.yaml]\nb: ${a + x}\nc: [1, 2]\n")
+        self.root = os.path.join(self.tmp, "root.yaml")
+
+    def test_result_cache(self):
+        cache = ResultCache()
+        defaults = {"x": 10}
+        d = read(self.root, defaults, result_cache=cache)
+        self.assertEqual(d, {"x": 10, "a": 1, "b": 11, "c": [1, 2]})
+        self.assertEqual(defaults, {"x": 10})
+
+        d["c"].append(3)
+        self.assertEqual(read(self.root, {"x": 10}, result_cache=cache)["c"], [1, 2])
+        self.assertEqual(read(self.root, {"x": 20}, result_cache=cache)["b"], 21)
+        self.assertEqual(cache.cache_info().hits, 1)
+        self.assertEqual(cache.cache_info().misses, 2)
+
+        self.write("conf.d/b.yaml", "a: 5\n")
+        self.assertEqual(read(self.root, {"x": 10}, result_cache=cache)["b"], 15)
+        self.write("conf.d/b.yaml", "a: 50\n")
+        self.assertEqual(read(self.root, {"x": 10}, result_cache=cache)["b"], 60)
+
+        frozen = read(self.root, {"x": 10}, freeze=True, result_cache=cache)
+        self.assertIs(
+            read(self.root, {"x": 10}, freeze=True, result_cache=cache), frozen
+        )
+
+        files = (name for name in [self.root])
+        self.assertEqual(read(files, {"x": 10}, result_cache=cache)["b"], 60)
+        hits = cache.cache_info().hits
+        read(iter([self.root]), {"x": 10}, stream=True, result_cache=cache)
+        self.assertEqual(cache.cache_info().hits, hits)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0, check_files=False)
+        read(self.root, {"x": 10}, result_cache=cache)
+        read(self.root, {"x": 10}, result_cache=cache)
+        self.assertEqual(cache.cache_info().hits, 0)
+
+        cache = ResultCache(check_files=False)
+        read(self.root, {"x": 10}, result_cache=cache)
+        self.write("conf.d/a.yaml", "a: 100\n")
+        self.assertEqual(read(self.root, {"x": 10}, result_cache=cache)["b"], 11)
+
+
+class TestReloader(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write("base.yaml", "a: 1\nb: ${a + 1}\nlazy: $(c * 10)\n")
+        self.write("mid.yaml", "extend: [base.yaml]\nm: ${b}\n")
+        self.write("other.yaml", "o: ${m}\n")
+        self.write("root.yaml", "extend: [mid.yaml, other.yaml]\nc: ${b * 2}\n")
+
+    def write(self, filename, content) -> str:
+        path = super().write(filename, content)
+        stat = os.stat(path)
+        # make the change visible on file systems with coarse timestamps
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        return path
+
+    def test_reload(self):
+        root = os.path.join(self.tmp, "root.yaml")
+        reloader = Reloader(root, {"mult": 1})
+        data, changed = reloader.reload()
+        self.assertEqual(
+            data, {"a": 1, "b": 2, "lazy": 40, "m": 2, "o": 2, "c": 4, "mult": 1}
+        )
+
+        self.assertIs(reloader.reload()[0], data)
+        self.assertEqual(reloader.changed_files(), [])
+
+        for c in [5, 6, 7]:
+            self.write(
+                "root.yaml", f"extend: [mid.yaml, other.yaml]\nc: ${{b * {c}}}\n"
+            )
+            self.assertEqual(reloader.changed_files(), [root])
+            data, changed = reloader.reload()
+            self.assertEqual(data, read(root, {"mult": 1}))
+            self.assertEqual(sorted(changed), [("c",), ("lazy",)])
+        self.assertEqual(len(reloader.checkpoints), 1)
+        self.assertEqual(reloader.file_cache.cache_info().misses, 7)
+
+        self.write("base.yaml", "a: 3\nb: ${a + 1}\nlazy: $(c * 10)\n")
+        data, changed = reloader.reload()
+        self.assertEqual(data, read(root, {"mult": 1}))
+        self.assertEqual(
+            sorted(changed), [("a",), ("b",), ("c",), ("lazy",), ("m",), ("o",)]
+        )
+
+        self.write("other.yaml", "o: ${a}\n")
+        data, changed = reloader.reload()
+        self.assertEqual(data, read(root, {"mult": 1}))
+        self.assertEqual(changed, [("o",)])
+
+    def test_content_hash(self):
+        root = os.path.join(self.tmp, "root.yaml")
+        reloader = Reloader(root, file_cache=FileCache(None, check_hash=True))
+        reloader.reload()
+        # the same size and modification time, but other content
+        stat = os.stat(root)
+        with open(root, "w") as f:
+            f.write("extend: [mid.yaml, other.yaml]\nc: ${b * 3}\n")
+        os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(reloader.changed_files(), [root])
+        self.assertEqual(reloader.reload()[0]["c"], 6)
+
+
+class TestBundle(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), "test_files"),
+            os.path.join(self.tmp, "test_files"),
+        )
+        self.bundle = os.path.join(self.tmp, "config.bundle")
+        self.files = [
+            os.path.join(self.tmp, "test_files", "test.yaml"),
+            os.path.join(self.tmp, "test_files", "test_m*.yaml"),
+        ]
+
+    def test_load(self):
+        expected = read(self.files, {"join": os.path.join})
+        self.assertEqual(
+            build_bundle(self.files, self.bundle, {"join": os.path.join}), expected
+        )
+
+        template_cache.cache_clear()
+        d = load_bundle(self.bundle, {"join": os.path.join})
+        self.assertEqual(d, expected)
+        self.assertEqual(list(d), list(expected))
+        self.assertEqual(template_cache.cache_info().misses, 0)
+
+    def test_stale(self):
+        build_bundle(self.files, self.bundle, {"join": os.path.join})
+        f3 = os.path.join(self.tmp, "test_files", "f3.yaml")
+        with open(f3, "a") as f:
+            f.write("\nnew_key: 1\n")
+        with self.assertRaises(StaleBundle):
+            load_bundle(self.bundle, {"join": os.path.join})
+
+        d = read_bundle(self.files, self.bundle, {"join": os.path.join})
+        self.assertEqual(d["new_key"], 1)
+        self.assertEqual(load_bundle(self.bundle, {"join": os.path.join}), d)
+
+        with open(os.path.join(self.tmp, "test_files", "test_more.yaml"), "w") as f:
+            f.write("more: 2\n")
+        with self.assertRaises(StaleBundle):
+            load_bundle(self.bundle, {"join": os.path.join})
+        d = read_bundle(self.files, self.bundle, {"join": os.path.join})
+        self.assertEqual(d["more"], 2)
+
+    def test_corrupt(self):
+        expected = build_bundle(self.files, self.bundle, {"join": os.path.join})
+        with open(self.bundle, "rb") as f:
+            content = f.read()
+        header = content[: len(BUNDLE_MAGIC) + 1 + len(importlib.util.MAGIC_NUMBER)]
+        missing_class = header + zlib.compress(b"cmetayaml.bundle\nMissing\n.")
+        for corrupt in [
+            content[:30],
+            content[:-10],
+            content[:20] + b"x" * 100,
+            missing_class,
+        ]:
+            with open(self.bundle, "wb") as f:
+                f.write(corrupt)
+            d = read_bundle(self.files, self.bundle, {"join": os.path.join})
+            self.assertEqual(d, expected)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ["config.bundle", "test_files"])
+
+
+class TestBatch(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write("base.yaml", "a: 1\nb: ${a + env}\nd: {x: 1}\nl: $(tenant * 2)\n")
+        self.files = []
+        for i in range(6):
+            cp = "c: ${cp(d, y=tenant)}\n" if i % 2 else ""
+            self.files.append(
+                self.write(f"t{i}.yaml", f"extend: [base.yaml]\ntenant: {i}\n{cp}")
+            )
+        self.files.append(
+            self.write("broken.yaml", "extend: [base.yaml]\nt: ${missing}\n")
+        )
+
+    def test_read_batch(self):
+        expected = [read(f, {"env": 10}) for f in self.files[:-1]]
+        for copy_on_write in [False, True]:
+            file_cache = FileCache(None)
+            checkpoints = Checkpoints()
+            result = read_batch(
+                self.files[:-1],
+                {"env": 10},
+                file_cache=file_cache,
+                checkpoints=checkpoints,
+                copy_on_write=copy_on_write,
+            )
+            self.assertEqual(result, expected)
+            self.assertEqual(file_cache.cache_info().misses, 7)
+            self.assertEqual(checkpoints.cache_info().hits, 4)
+
+        result = read_batch(self.files, {"env": 10}, return_exceptions=True)
+        self.assertEqual(result[:-1], expected)
+        self.assertIsInstance(result[-1], MetaYamlException)
+        with self.assertRaises(MetaYamlException):
+            read_batch(self.files, {"env": 10})
+
+    def test_process_pool(self):
+        expected = [read(f, {"env": 10}) for f in self.files[:-1]]
+        with ProcessPoolExecutor(2) as executor:
+            result = read_batch(self.files[:-1], {"env": 10}, executor=executor)
+        self.assertEqual(result, expected)
+
+
+class TestShared(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, "config.shared")
+
+    def test_publish(self):
+        d = read(TestMetaYaml._file_name("test_order.yaml"))
+        d["values"] = [
+            None,
+            True,
+            False,
+            1.5,
+            -(2**70),
+            b"raw",
+            {"nested": [1, {"a": "b"}]},
+        ]
+        publish(d, self.path)
+
+        config = SharedConfig(self.path)
+        self.assertIsInstance(config.data, SharedDict)
+        self.assertEqual(config.data, d)
+        self.assertEqual(list(config.data), list(d))
+        self.assertEqual(config.data.materialize(), d)
+        self.assertEqual(config.data["schedule"][3600], "each hour")
+        self.assertNotIn("missing", config.data)
+        self.assertEqual(config.get(("values", 6, "nested", 1, "a")), "b")
+        self.assertEqual(config.get(("values", 10), "default"), "default")
+        self.assertEqual(config.get("values[6].nested[1].a"), "b")
+        self.assertEqual(config.get(("schedule", 3600.0)), "each hour")
+        self.assertEqual(config.get("values[-1].nested[0]"), 1)
+        self.assertEqual(
+            config.data["values"][-3:], [-(2**70), b"raw", {"nested": [1, {"a": "b"}]}]
+        )
+
+    def test_numeric_keys(self):
+        publish({1: "int", 2.5: "float", 3: "three"}, self.path)
+        data = SharedConfig(self.path).data
+        for key in [1, 1.0, True, 2.5, 3, 3.0]:
+            self.assertEqual(data[key], {1: "int", 2.5: "float", 3: "three"}[key])
+        self.assertNotIn("1", data)
+        self.assertNotIn(2, data)
+
+    def test_refresh(self):
+        publish({"version": 1, "items": [1, 2]}, self.path)
+        config = SharedConfig(self.path)
+        items = config.data["items"]
+        self.assertFalse(config.refresh())
+
+        publish({"version": 2}, self.path)
+        self.assertTrue(config.refresh())
+        self.assertEqual(config.data, {"version": 2})
+        self.assertEqual(items, [1, 2])
+
+
+class TestPathIndex(TestCase):
+
+    def test_get(self):
+        m = MetaYaml(TestMetaYaml._file_name("test_order.yaml"))
+        self.assertEqual(m.get("HOUR"), 3600)
+        self.assertEqual(m.get("schedule[3600]"), "each hour")
+        self.assertEqual(m.get(("schedule", 31536000)), "each year 60")
+        self.assertIs(m.get(""), m.data)
+        self.assertIsNone(m.get("schedule.missing"))
+        self.assertEqual(m.get_many(["MINUTE", "DAY", "missing"], 0), [60, 86400, 0])
+
+        m.set("schedule[3600]", "hourly")
+        m.merge("", {"extra": {"a": [1]}})
+        m.extend("extra.a", [2])
+        m.delete("MINUTE")
+        self.assertEqual(m.get_many(["schedule[3600]", "extra.a[1]"]), ["hourly", 2])
+        self.assertEqual((m.data["extra"], m.get("MINUTE")), ({"a": [1, 2]}, None))
+        m.data["HOUR"] = 1
+        m.index.rebuild()
+        self.assertEqual(m.get("HOUR"), 1)
+
+    def test_update(self):
+        index = PathIndex(
+            {"services": [{"port": 80}, {"port": 81}], "db": {"host": "a"}}
+        )
+        index.set("services[1].port", 8080)
+        self.assertEqual(index.get("services[1].port"), 8080)
+        index.delete("services[0]")
+        self.assertEqual(index.get("services[0].port"), 8080)
+        self.assertNotIn("services[1]", index)
+        index.extend("services", [{"port": 90}])
+        self.assertEqual(index.get(("services", 1, "port")), 90)
+        index.merge("db", {"host": "b", "options": {"timeout": 5}})
+        self.assertEqual(index.get("db.options.timeout"), 5)
+        index.set(("db", "options"), 1)
+        self.assertNotIn("db.options.timeout", index)
+        index.delete("db.host")
+        self.assertNotIn("db.host", index)
+        self.assertEqual(
+            index.data,
+            {"services": [{"port": 8080}, {"port": 90}], "db": {"options": 1}},
+        )
+        self.assertEqual(len(index), len(PathIndex(index.data)))
+        with self.assertRaises(KeyError):
+            index.set("missing.key", 1)
+
+
+class TestOnly(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write(
+            "base.yaml",
+            "db:\n  host: localhost\n  port: 5432\n"
+            "heavy:\n  ${__inherit__}: db\n  extra: ${missing}\n",
+        )
+        self.write(
+            "root.yaml",
+            "extend: [base.yaml]\n"
+            "db:\n  port: 6432\n"
+            "api:\n  url: http://${db.host}:${db.port}\n"
+            "  timeout: $(worker.timeout * 2)\n"
+            "  name: api\n"
+            "worker:\n  timeout: 5\n",
+        )
+        self.root = os.path.join(self.tmp, "root.yaml")
+
+    def test_only(self):
+        with self.assertRaises(MetaYamlException):
+            read(self.root)
+        api = {"url": "http://localhost:6432", "timeout": 10, "name": "api"}
+        self.assertEqual(read(self.root, only=["api"]), {"api": api})
+        self.assertEqual(
+            read(self.root, only=["api.url", ("worker",)]),
+            {"api": {"url": "http://localhost:6432"}, "worker": {"timeout": 5}},
+        )
+        self.assertEqual(
+            read(self.root, only=["api"], evaluation="topological"), {"api": api}
+        )
+        self.assertEqual(read(self.root, only=["api"], stream=True), {"api": api})
+        defaults = {"x": 1}
+        self.assertEqual(
+            read(self.root, defaults, only=["api", "x", "missing"]),
+            {"api": api, "x": 1},
+        )
+        self.assertEqual(defaults, {"x": 1})
+
+    def test_order(self):
+        full = read(TestMetaYaml._file_name("inherit.yaml"))
+        for key in full:
+            self.assertEqual(
+                read(TestMetaYaml._file_name("inherit.yaml"), only=[key]),
+                {key: full[key]},
+            )
+        with self.assertRaises(MetaYamlException):
+            read(self.root, only=["api"], lazy=True)
+
+    def test_referenced_order(self):
+        self.write("ports.yaml", "base_port: 1\ndb:\n  port: ${base_port}\n")
+        self.write(
+            "ports_root.yaml",
+            "extend: [ports.yaml]\nbase_port: 2\napi:\n  url: ${db.port}\n",
+        )
+        root = os.path.join(self.tmp, "ports_root.yaml")
+        # topological expressions see the final value of base_port
+        for evaluation, url in [("ordered", 1), ("topological", 2)]:
+            self.assertEqual(read(root, evaluation=evaluation)["api"], {"url": url})
+            for stream in [False, True]:
+                self.assertEqual(
+                    read(root, only=["api"], evaluation=evaluation, stream=stream),
+                    {"api": {"url": url}},
+                )
+
+    def test_str(self):
+        self.assertEqual(read(self.root, only="worker"), {"worker": {"timeout": 5}})
+        cache = ResultCache()
+        read(self.root, only="worker", result_cache=cache)
+        read(self.root, only=["worker"], result_cache=cache)
+        self.assertEqual(cache.cache_info().hits, 1)
+
+
+class TestRenderPlan(TempFilesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write(
+            "root.yaml",
+            "extend: ['env_${env}.yaml']\n"
+            "url: http://${host}:${port}/${region}\n"
+            "replicas: $(workers * 2)\n",
+        )
+        self.write("env_dev.yaml", "host: localhost\nport: 8000\nworkers: 1\n")
+        self.write("env_prod.yaml", "host: example.com\nport: 443\nworkers: 4\n")
+        self.root = os.path.join(self.tmp, "root.yaml")
+        self.variants = [
+            {"env": env, "region": region}
+            for env in ("dev", "prod")
+            for region in ("eu", "us")
+        ]
+
+    def test_render(self):
+        plan = RenderPlan(self.root, freeze=True)
+        expected = [read(self.root, deepcopy(d), freeze=True) for d in self.variants]
+        self.assertEqual(plan.render_many(self.variants), expected)
+        self.assertEqual(plan.render({"env": "dev", "region": "eu"}), expected[0])
+        self.assertEqual(len(plan.documents), 3)
+        self.assertEqual(self.variants[0], {"env": "dev", "region": "eu"})
+
+        errors = plan.render_many([{"env": "test"}], return_exceptions=True)
+        self.assertIsInstance(errors[0], MetaYamlException)
+        with self.assertRaisesRegex(MetaYamlException, "stream, file_cache"):
+            RenderPlan(self.root, stream=True, file_cache=FileCache())
+
+    def test_executor(self):
+        expected = [read(self.root, deepcopy(d)) for d in self.variants]
+        for executor_class in (ThreadPoolExecutor, ProcessPoolExecutor):
+            plan = RenderPlan(self.root)
+            with executor_class(2) as executor:
+                self.assertEqual(plan.render_many(self.variants, executor), expected)
+
+        plan = pickle.loads(pickle.dumps(plan))
+        self.assertEqual(plan.render(deepcopy(self.variants[3])), expected[3])
+
+
+class TestAsync(TestCase):
+
+    def test_read_async(self):
+        file_name = TestMetaYaml._file_name("test.yaml")
+        defaults = {"CWD": os.getcwd(), "join": os.path.join}
+        d = asyncio.run(read_async(file_name, defaults))
+        self.assertEqual(d, read(file_name, defaults))
+
+    def test_read_many(self):
+        names = ["cp.yaml", "inherit.yaml", "missing.yaml", "list_eval.yaml"]
+        files = [TestMetaYaml._file_name(name) for name in names]
+        with ThreadPoolExecutor(2) as executor:
+            result = asyncio.run(
+                read_many(
+                    files,
+                    {"join": os.path.join},
+                    limit=2,
+                    executor=executor,
+                    return_exceptions=True,
+                )
+            )
+        self.assertEqual(result[0], read(files[0], {"join": os.path.join}))
+        self.assertEqual(result[1], read(files[1], {"join": os.path.join}))
+        self.assertIsInstance(result[2], MetaYamlException)
+        self.assertEqual(result[3], read(files[3], {"join": os.path.join}))
+
+        with self.assertRaises(MetaYamlException):
+            asyncio.run(read_many(files))
+
+
+class TestProfile(TestCase):
+
+    def test_profile(self):
+        events = []
+        file_name = TestMetaYaml._file_name("test.yaml")
+        profile = Profile(callback=events.append)
+        template_cache.cache_clear()
+        d = read(file_name, {"CWD": os.getcwd(), "join": os.path.join}, profile=profile)
+        self.assertEqual(d, read(file_name, {"CWD": os.getcwd(), "join": os.path.join}))
+
+        self.assertEqual(events, profile.events)
+        parsed = [e.name for e in profile.events if e.kind == "parse"]
+        self.assertIn(file_name, parsed)
+        self.assertEqual(profile.counts["parse"], profile.counts["merge"])
+        self.assertGreater(profile.counts["compile"], 0)
+        self.assertIn(
+            "test.yaml.test_math",
+            [e.name for e in profile.events if e.kind == "render"],
+        )
+
+        report = profile.report(top=3)
+        self.assertEqual(report["counts"], profile.counts)
+        self.assertEqual(report["template_cache"]["misses"], profile.counts["compile"])
+        self.assertLessEqual(len(report["slowest_files"]), 3)
+        self.assertIn(report["slowest_files"][0][0], parsed)
+
+    def test_file_cache(self):
+        file_cache = FileCache()
+        file_name = TestMetaYaml._file_name("test.yaml")
+        read(
+            file_name, {"CWD": os.getcwd(), "join": os.path.join}, file_cache=file_cache
+        )
+        profile = Profile(keep_events=False)
+        read(
+            file_name,
+            {"CWD": os.getcwd(), "join": os.path.join},
+            file_cache=file_cache,
+            profile=profile,
+        )
+        self.assertEqual(profile.events, [])
+        self.assertEqual(profile.file_cache_misses, 0)
+        self.assertEqual(profile.file_cache_hits, profile.counts["parse"])
+
+    def test_keep_slowest(self):
+        profile = Profile(keep_events=False, keep_slowest=2)
+        for i in range(5):
+            profile.record("parse", f"f{i}.yaml", float(i))
+        profile.record("render", ("a", 0), 0.5)
+        report = profile.report()
+        self.assertEqual(report["slowest_files"], [("f4.yaml", 4.0), ("f3.yaml", 3.0)])
+        self.assertEqual(report["slowest_paths"], [("a[0]", 0.5)])
+        self.assertEqual(report["counts"], {"parse": 5, "render": 1})
+
+
 if __name__ == '__main__':
     main()